@@ -0,0 +1,333 @@
+import base64
+import posixpath
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from recipes.fake_data import FAKE_IMAGE, FAKE_PASSWORD
+from recipes.images import wait_for_image_variants
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscription, User
+
+from api.profiling import is_savepoint
+
+SHOPPING_CART_FORMATS = ('txt', 'csv', 'json', 'pdf')
+
+
+def make_png(size=(64, 64)):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[round((len(values) - 1) * percent / 100)]
+
+
+def get_client(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def testserver_settings():
+    """Разрешает хост testserver, с которым работает тестовый клиент.
+
+    Микрокеш анонимных ответов выключен: иначе анонимные сценарии
+    замеряли бы попадание в кеш без запросов вместо пути через ORM.
+    """
+    return override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ANONYMOUS_RECIPES_CACHE_TTL=0,
+    )
+
+
+@contextmanager
+def rolled_back(rollback=True):
+    """Откатывает все изменения базы за время блока.
+
+    Обработчики on_commit внутри блока не выполняются.
+    """
+    if not rollback:
+        yield
+        return
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(client, path, repeat=10, method='get', data=None, setup=None):
+    """Число SQL-запросов, p50/p95 времени ответа и размер ответа.
+
+    queries - наибольшее число запросов среди повторов: первый повтор
+    обычно идёт мимо кешей. queries_last - число запросов последнего.
+    Изменяющие запросы (не GET) вместе с setup выполняются в
+    откатываемой транзакции, поэтому база после замера не меняется;
+    SAVEPOINT вложенных в неё транзакций не считаются. setup
+    выполняется вне замера перед каждым запросом - например, чтобы
+    создать удаляемую запросом запись, и может вернуть адрес запроса.
+    """
+    timings = []
+    query_counts = []
+    for _ in range(repeat):
+        with rolled_back(method != 'get'):
+            url = setup() if setup is not None else None
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(
+                    url or path, data, format='json'
+                )
+                content = (
+                    b''.join(response.streaming_content)
+                    if response.streaming else response.content
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(sum(
+            not is_savepoint(query['sql'])
+            for query in queries.captured_queries
+        ))
+    return {
+        'method': method.upper(),
+        'path': path,
+        'status': response.status_code,
+        'queries': max(query_counts),
+        'queries_last': query_counts[-1],
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'bytes': len(content),
+    }
+
+
+def list_media(path):
+    """Имена всех файлов хранилища в каталоге path и вложенных."""
+    try:
+        directories, files = default_storage.listdir(path)
+    except FileNotFoundError:
+        return set()
+    names = {posixpath.join(path, name) for name in files}
+    for directory in directories:
+        names |= list_media(posixpath.join(path, directory))
+    return names
+
+
+@contextmanager
+def media_restored():
+    """Удаляет изображения рецептов, появившиеся за время блока.
+
+    Перед сравнением дожидается фоновой обработки изображений, чтобы
+    уменьшенные копии не появились уже после уборки.
+    """
+    path = Recipe._meta.get_field('image').upload_to
+    before = list_media(path)
+    try:
+        yield
+    finally:
+        wait_for_image_variants()
+        for name in list_media(path) - before:
+            default_storage.delete(name)
+
+
+def get_dataset_size():
+    return {
+        model.__name__: model.objects.count()
+        for model in (User, Tag, Ingredient, Recipe, IngredientRecipe,
+                      Favorite, ShoppingCart, ShoppingListItem,
+                      Subscription)
+    }
+
+
+def recipe_payload(tag_ids, ingredient_ids):
+    return {
+        'name': 'Рецепт для замера',
+        'text': 'Описание приготовления.',
+        'cooking_time': 30,
+        'image': (
+            'data:image/png;base64,' + base64.b64encode(make_png()).decode()
+        ),
+        'tags': tag_ids,
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in ingredient_ids
+        ],
+    }
+
+
+def get_benchmark_user(email=None):
+    """Пользователь с рецептами, избранным и корзиной."""
+    users = User.objects.all()
+    if email:
+        return users.filter(email=email).first()
+    return (
+        users.filter(pk__in=ShoppingCart.objects.values('user'))
+        .filter(pk__in=Recipe.objects.values('author'))
+        .first()
+        or users.first()
+    )
+
+
+def get_scenarios(user):
+    """Сценарии для всех маршрутов api/urls.py.
+
+    Каждый сценарий - словарь с аргументами measure и флагом anonymous.
+    Изменения базы откатывает measure, новые файлы изображений убирает
+    run_scenarios.
+    """
+    recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+    own_recipe = user.recipes.order_by('-id').first()
+    free_recipe = (
+        Recipe.objects
+        .exclude(pk__in=Favorite.objects.filter(user=user).values('recipe'))
+        .exclude(
+            pk__in=ShoppingCart.objects.filter(user=user).values('recipe')
+        )
+        .order_by('-id').first()
+    )
+    author = (
+        User.objects.exclude(pk=user.pk)
+        .exclude(pk__in=Subscription.objects.filter(subscriber=user)
+                 .values('author'))
+        .first()
+    )
+    ingredient = Ingredient.objects.order_by('id').first()
+    tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+    tag_ids = list(Tag.objects.values_list('id', flat=True)[:2])
+    ingredient_ids = list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True)[:5]
+    )
+    tags_query = '&'.join(f'tags={slug}' for slug in tag_slugs)
+    prefix = ingredient.name[:2]
+
+    def create_user_relation(model, recipe_id):
+        def setup():
+            model.objects.get_or_create(user=user, recipe_id=recipe_id)
+        return setup
+
+    def create_subscription():
+        Subscription.objects.get_or_create(subscriber=user, author=author)
+
+    def create_token():
+        Token.objects.get_or_create(user=user)
+
+    def create_recipe():
+        recipe = Recipe.objects.create(
+            author=user, name='Удаляемый рецепт', text='-', cooking_time=1,
+            image=FAKE_IMAGE
+        )
+        return f'/api/recipes/{recipe.id}/'
+
+    scenarios = [
+        {'name': 'recipes.list', 'anonymous': True,
+         'path': '/api/recipes/'},
+        {'name': 'recipes.list', 'path': '/api/recipes/'},
+        {'name': 'recipes.list.page_100', 'path': '/api/recipes/?page=100'},
+        {'name': 'recipes.list.cursor',
+         'path': '/api/recipes/?pagination=cursor'},
+        {'name': 'recipes.list.tags', 'path': f'/api/recipes/?{tags_query}'},
+        {'name': 'recipes.list.is_favorited',
+         'path': '/api/recipes/?is_favorited=1'},
+        {'name': 'recipes.list.is_in_shopping_cart',
+         'path': '/api/recipes/?is_in_shopping_cart=1'},
+        {'name': 'recipes.list.author',
+         'path': f'/api/recipes/?author={user.id}'},
+        {'name': 'recipes.list.search', 'anonymous': True,
+         'path': f'/api/recipes/?search={quote(recipe.name)}'},
+        {'name': 'recipes.list.search.tags',
+         'path': f'/api/recipes/?search={quote(recipe.name)}&{tags_query}'},
+        {'name': 'recipes.detail', 'anonymous': True,
+         'path': f'/api/recipes/{recipe.id}/'},
+        {'name': 'recipes.detail', 'path': f'/api/recipes/{recipe.id}/'},
+    ]
+    scenarios += [
+        {'name': f'recipes.download_shopping_cart.{cart_format}',
+         'path': ('/api/recipes/download_shopping_cart/'
+                  f'?format={cart_format}')}
+        for cart_format in SHOPPING_CART_FORMATS
+    ]
+    scenarios.append({'name': 'recipes.shopping_cart_summary',
+                      'path': '/api/recipes/shopping_cart_summary/'})
+    scenarios += [
+        {'name': 'tags.list', 'anonymous': True, 'path': '/api/tags/'},
+        {'name': 'tags.detail', 'anonymous': True,
+         'path': f'/api/tags/{tag_ids[0]}/'},
+        {'name': 'ingredients.list', 'anonymous': True,
+         'path': '/api/ingredients/'},
+        {'name': 'ingredients.search', 'anonymous': True,
+         'path': f'/api/ingredients/?name={prefix}'},
+        {'name': 'ingredients.autocomplete', 'anonymous': True,
+         'path': f'/api/ingredients/autocomplete/?name={prefix}'},
+        {'name': 'ingredients.detail', 'anonymous': True,
+         'path': f'/api/ingredients/{ingredient.id}/'},
+        {'name': 'users.list', 'anonymous': True, 'path': '/api/users/'},
+        {'name': 'users.list', 'path': '/api/users/'},
+        {'name': 'users.detail', 'path': f'/api/users/{author.id}/'},
+        {'name': 'users.me', 'path': '/api/users/me/'},
+        {'name': 'users.subscriptions', 'path': '/api/users/subscriptions/'},
+        {'name': 'users.subscriptions.recipes_limit',
+         'path': '/api/users/subscriptions/?recipes_limit=3'},
+        {'name': 'users.subscribe', 'method': 'post',
+         'path': f'/api/users/{author.id}/subscribe/'},
+        {'name': 'users.unsubscribe', 'method': 'delete',
+         'path': f'/api/users/{author.id}/subscribe/',
+         'setup': create_subscription},
+        {'name': 'recipes.favorite', 'method': 'post',
+         'path': f'/api/recipes/{free_recipe.id}/favorite/'},
+        {'name': 'recipes.unfavorite', 'method': 'delete',
+         'path': f'/api/recipes/{free_recipe.id}/favorite/',
+         'setup': create_user_relation(Favorite, free_recipe.id)},
+        {'name': 'recipes.shopping_cart.add', 'method': 'post',
+         'path': f'/api/recipes/{free_recipe.id}/shopping_cart/'},
+        {'name': 'recipes.shopping_cart.remove', 'method': 'delete',
+         'path': f'/api/recipes/{free_recipe.id}/shopping_cart/',
+         'setup': create_user_relation(ShoppingCart, free_recipe.id)},
+        {'name': 'recipes.create', 'method': 'post', 'path': '/api/recipes/',
+         'data': recipe_payload(tag_ids, ingredient_ids)},
+        {'name': 'recipes.delete', 'method': 'delete',
+         'path': '/api/recipes/{id}/', 'setup': create_recipe},
+        {'name': 'auth.token.login', 'anonymous': True, 'method': 'post',
+         'path': '/api/auth/token/login/',
+         'data': {'email': user.email, 'password': FAKE_PASSWORD}},
+        {'name': 'auth.token.logout', 'method': 'post',
+         'path': '/api/auth/token/logout/',
+         'setup': create_token},
+        {'name': 'users.create', 'anonymous': True, 'method': 'post',
+         'path': '/api/users/',
+         'data': {'email': 'benchmark-new@example.org',
+                  'username': 'benchmark-new', 'first_name': 'Bench',
+                  'last_name': 'New', 'password': 'salt-and-pepper-42'}},
+        {'name': 'users.set_password', 'method': 'post',
+         'path': '/api/users/set_password/',
+         'data': {'current_password': FAKE_PASSWORD,
+                  'new_password': FAKE_PASSWORD}},
+    ]
+    if own_recipe is not None:
+        scenarios.append(
+            {'name': 'recipes.update', 'method': 'patch',
+             'path': f'/api/recipes/{own_recipe.id}/',
+             'data': recipe_payload(tag_ids, ingredient_ids)}
+        )
+    return scenarios
+
+
+def run_scenarios(user, repeat=10, only=None):
+    """Прогоняет сценарии; only - префиксы имён сценариев."""
+    clients = {True: get_client(), False: get_client(user)}
+    with testserver_settings(), media_restored():
+        for scenario in get_scenarios(user):
+            name = scenario.pop('name')
+            if only and not name.startswith(tuple(only)):
+                continue
+            anonymous = scenario.pop('anonymous', False)
+            path = scenario.pop('path')
+            result = measure(clients[anonymous], path, repeat, **scenario)
+            yield {'name': name, 'anonymous': anonymous, **result}
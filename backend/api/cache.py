@@ -0,0 +1,375 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from recipes.cache import get_catalogue_version
+from recipes.models import Favorite, ShoppingCart
+from rest_framework import serializers
+from users.models import Subscription, User
+
+from api.prefetch import optimize_queryset
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def get_user_state(user):
+    """Число и последний id избранного, корзины и подписок пользователя.
+
+    Меняется при любом добавлении или удалении, поэтому подходит для
+    ETag ответов с is_favorited, is_in_shopping_cart и is_subscribed.
+    Считается одним запросом.
+    """
+    if user.is_anonymous:
+        return None
+    annotations = {}
+    for name, model, field in (
+        ('favorites', Favorite, 'user'),
+        ('cart', ShoppingCart, 'user'),
+        ('subscriptions', Subscription, 'subscriber'),
+    ):
+        rows = model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field)
+        annotations[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('id')).values('value')
+        )
+        annotations[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('id')).values('value')
+        )
+    return User.objects.filter(pk=user.pk).annotate(
+        **annotations
+    ).values_list(*annotations).first()
+
+
+class ConditionalGetMixin:
+    """Условные GET для list/retrieve: ETag, Last-Modified и 304.
+
+    Валидаторы считаются дешёвыми запросами до сериализации; при
+    совпадении с If-None-Match / If-Modified-Since ответ 304
+    возвращается без выборки страницы.
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def get_conditional_response(self, request, handler, *args, **kwargs):
+        etag = self.get_etag(request, *args, **kwargs)
+        etag = quote_etag(etag) if etag else None
+        last_modified = self.get_last_modified(request, *args, **kwargs)
+        last_modified = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, no_cache=True)
+            # ответ зависит от пользователя: токена или сессии в cookie
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, super().list,
+                                             *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, super().retrieve,
+                                             *args, **kwargs)
+
+
+class CatalogueCacheMixin:
+    """Кеширует готовый JSON list/retrieve справочников.
+
+    Ключ включает путь, отсортированные параметры запроса и версию
+    справочников, которую повышают сигналы Tag и Ingredient; при
+    попадании в кеш ORM и сериализатор не вызываются.
+    """
+
+    def get_cache_key(self, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        # хеш: у memcached ключ не длиннее 250 символов
+        return 'catalogue:' + make_etag(
+            get_catalogue_version(), request.path, query
+        )
+
+    def get_cached_response(self, request, handler, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        content = cache.get(key)
+        if content is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            cache.set(key, content, settings.CATALOGUE_CACHE_TIMEOUT)
+        return HttpResponse(content, content_type=renderer.media_type)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super().list,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super().retrieve,
+                                        *args, **kwargs)
+
+
+class CatalogueConditionalGetMixin(ConditionalGetMixin):
+    """ETag справочников строится из версии каталога, без запросов к БД."""
+
+    def get_etag(self, request, *args, **kwargs):
+        return make_etag(get_catalogue_version(), request.get_full_path())
+
+
+ANONYMOUS_CACHE_STATS = ('hit', 'stale', 'miss')
+ANONYMOUS_CACHE_STATS_KEY = 'anonymous:stats:{}'
+# заголовки ConditionalGetMixin, которые хранятся вместе с ответом
+ANONYMOUS_CACHE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+def count_anonymous_cache(status):
+    key = ANONYMOUS_CACHE_STATS_KEY.format(status)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_anonymous_cache_stats():
+    """Счётчики попаданий, устаревших ответов и промахов.
+
+    Общие для всех процессов, только если общий кеш по умолчанию.
+    """
+    values = cache.get_many([
+        ANONYMOUS_CACHE_STATS_KEY.format(status)
+        for status in ANONYMOUS_CACHE_STATS
+    ])
+    return {
+        status: values.get(ANONYMOUS_CACHE_STATS_KEY.format(status), 0)
+        for status in ANONYMOUS_CACHE_STATS
+    }
+
+
+def reset_anonymous_cache_stats():
+    cache.delete_many([
+        ANONYMOUS_CACHE_STATS_KEY.format(status)
+        for status in ANONYMOUS_CACHE_STATS
+    ])
+
+
+class AnonymousCacheMixin:
+    """Микрокеш готовых ответов list/retrieve для анонимов.
+
+    Ответ живёт ANONYMOUS_RECIPES_CACHE_TTL секунд, ключ - схема, хост,
+    путь и параметры запроса, отсортированные вместе со значениями. Истёкший
+    ответ пересчитывает только процесс, взявший блокировку, остальные
+    ещё ANONYMOUS_RECIPES_CACHE_STALE_TTL секунд отдают устаревший. Если
+    устаревшего нет, они ждут пересчёта до ANONYMOUS_RECIPES_CACHE_WAIT
+    секунд. Исход попадает в заголовок X-Cache и счётчики
+    get_anonymous_cache_stats.
+    """
+
+    def get_anonymous_cache_key(self, request):
+        query = urlencode(sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        ), doseq=True)
+        # в ответе абсолютные ссылки на изображения: ключ зависит от хоста
+        return 'anonymous:' + make_etag(
+            request.build_absolute_uri('/'), request.path, query
+        )
+
+    def render_anonymous_entry(self, request, response):
+        renderer = request.accepted_renderer
+        return {
+            'expires': time.time() + settings.ANONYMOUS_RECIPES_CACHE_TTL,
+            'content': renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            ),
+            'content_type': renderer.media_type,
+            'headers': {
+                name: response[name] for name in ANONYMOUS_CACHE_HEADERS
+                if response.has_header(name)
+            },
+        }
+
+    def wait_for_anonymous_entry(self, key):
+        deadline = time.monotonic() + settings.ANONYMOUS_RECIPES_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def get_anonymous_response(self, request, handler, *args, **kwargs):
+        if (not settings.ANONYMOUS_RECIPES_CACHE_TTL
+                or request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return handler(request, *args, **kwargs)
+        key = self.get_anonymous_cache_key(request)
+        lock = f'{key}:lock'
+        entry = cache.get(key)
+        status = 'hit'
+        if entry is None or entry['expires'] <= time.time():
+            if cache.add(lock, 1, settings.ANONYMOUS_RECIPES_CACHE_LOCK_TIMEOUT):
+                try:
+                    response = handler(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    entry = self.render_anonymous_entry(request, response)
+                    cache.set(key, entry, (
+                        settings.ANONYMOUS_RECIPES_CACHE_TTL
+                        + settings.ANONYMOUS_RECIPES_CACHE_STALE_TTL
+                    ))
+                finally:
+                    cache.delete(lock)
+                status = 'miss'
+            elif entry is not None:
+                status = 'stale'
+            else:
+                entry = self.wait_for_anonymous_entry(key)
+                if entry is None:
+                    # пересчёт затянулся: считаем сами, не трогая кеш
+                    count_anonymous_cache('miss')
+                    response = handler(request, *args, **kwargs)
+                    response['X-Cache'] = 'MISS'
+                    return response
+        count_anonymous_cache(status)
+        headers = entry['headers']
+        response = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(
+                headers.get('Last-Modified', '')
+            )
+        )
+        if response is None:
+            response = HttpResponse(entry['content'],
+                                    content_type=entry['content_type'])
+        for name, value in headers.items():
+            response[name] = value
+        response['X-Cache'] = status.upper()
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_anonymous_response(request, super().list,
+                                           *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_anonymous_response(request, super().retrieve,
+                                           *args, **kwargs)
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    """Отдаёт всю страницу ленты одним обращением к кешу."""
+
+    def to_representation(self, data):
+        return self.child.to_representation_many(list(data))
+
+
+class RecipeFragmentCacheMixin:
+    """Кеширует общую для всех пользователей часть JSON рецепта.
+
+    Фрагмент хранится по id рецепта, его updated_at, версии
+    справочников и адресу сайта (ссылки на изображения абсолютные).
+    Зависящие от пользователя поля - user_fields и author.is_subscribed -
+    кладутся поверх фрагмента при каждом ответе. Для страницы из кеша
+    достаточно строк row_fields с аннотациями флагов; полные строки с
+    тегами и ингредиентами загружаются только для промахов.
+    """
+    row_fields = ('id', 'author', 'pub_date', 'updated_at')
+    user_fields = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_fragment_prefix(self):
+        request = self.context.get('request')
+        return 'recipe-fragment:' + make_etag(
+            type(self).__name__,
+            get_catalogue_version(),
+            request.build_absolute_uri('/') if request else None
+        )
+
+    def render_fragments(self, recipes):
+        rows = optimize_queryset(
+            self.Meta.model.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ),
+            self
+        ).in_bulk()
+        fragments = {}
+        for recipe in recipes:
+            row = rows.get(recipe.pk)
+            if row is None:
+                continue
+            for field in self.user_fields:
+                # флаги уже посчитаны аннотациями строки страницы
+                if hasattr(recipe, field):
+                    setattr(row, field, getattr(recipe, field))
+            data = super().to_representation(row)
+            for field in self.user_fields:
+                data[field] = None
+            data['author']['is_subscribed'] = None
+            fragments[recipe.pk] = data
+        return fragments
+
+    def overlay(self, fragment, recipe):
+        data = fragment.copy()
+        for field in self.user_fields:
+            data[field] = self.fields[field].to_representation(recipe)
+        data['author'] = fragment['author'].copy()
+        data['author']['is_subscribed'] = (
+            recipe.author_id in self.fields['author'].get_subscriptions()
+        )
+        return data
+
+    def to_representation_many(self, recipes):
+        prefix = self.get_fragment_prefix()
+        keys = {
+            recipe.pk: f'{prefix}:{recipe.pk}:{recipe.updated_at.timestamp()}'
+            for recipe in recipes
+        }
+        cached = cache.get_many(keys.values())
+        fragments = {
+            pk: cached[key] for pk, key in keys.items() if key in cached
+        }
+        missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if missing:
+            rendered = self.render_fragments(missing)
+            cache.set_many(
+                {keys[pk]: data for pk, data in rendered.items()},
+                settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+            )
+            fragments.update(rendered)
+        return [
+            self.overlay(fragments[recipe.pk], recipe)
+            for recipe in recipes if recipe.pk in fragments
+        ]
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
@@ -3,3 +3,8 @@ from rest_framework.exceptions import APIException
 
 class BadRequestException(APIException):
     status_code = 400
+
+
+class RequestEntityTooLargeException(APIException):
+    status_code = 413
+    default_detail = 'Слишком большой запрос.'
@@ -0,0 +1,128 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class Base64ImageField(serializers.ImageField):
+    """Изображение в base64 (data URI) с ограничением размера.
+
+    Строка декодируется частями во временный файл, который остаётся в
+    памяти до FILE_UPLOAD_MAX_MEMORY_SIZE и дальше уходит на диск.
+    Размер в байтах проверяется до декодирования, число пикселей - по
+    заголовку изображения, до распаковки растра.
+    """
+    EMPTY_VALUES = (None, '', [], (), {})
+    # кратно 4, чтобы каждая часть декодировалась независимо
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'invalid_base64': 'Ожидается изображение в формате base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+        'invalid_format': 'Допустимые форматы: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        encoded = data.partition(';base64,')[2] or data
+        if len(encoded) // 4 * 3 > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_BYTES)
+        file = self.decode(encoded)
+        extension = self.check_image(file)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
+
+    def decode(self, encoded):
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        try:
+            for start in range(0, len(encoded), self.chunk_size):
+                file.write(base64.b64decode(
+                    encoded[start:start + self.chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
+
+    def check_image(self, file):
+        checked = False
+        try:
+            # Image.open читает только заголовок
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format
+                if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+                    self.fail('too_many_pixels',
+                              max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+                if image_format not in IMAGE_EXTENSIONS:
+                    self.fail('invalid_format',
+                              formats=', '.join(IMAGE_EXTENSIONS.values()))
+                image.verify()
+            checked = True
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            # при любой ошибке файл больше не нужен
+            if not checked:
+                file.close()
+        file.seek(0)
+        return IMAGE_EXTENSIONS[image_format]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, проверенный одним запросом in_bulk.
+
+    ManyRelatedField загружает объекты по одному запросу на ключ.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        ids = []
+        for pk in data:
+            try:
+                if isinstance(pk, bool):
+                    raise TypeError
+                ids.append(int(pk))
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(pk).__name__
+                )
+        objects = self.child_relation.get_queryset().in_bulk(ids)
+        for pk in ids:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in ids]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, у которого many=True проверяет ключи
+    одним запросом."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
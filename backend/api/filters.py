@@ -1,24 +1,33 @@
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
 from django_filters import rest_framework as django_filters
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 CHOICES = ((1, 1), (0, 0))
 
 
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        # LOWER(name) LIKE 'x%' обслуживается индексом из миграции 0005
+        return queryset.annotate(name_lower=Lower('name')).filter(
+            name_lower__startswith=value.lower()
+        )
+
 
 class RecipeFilter(django_filters.FilterSet):
     author = django_filters.NumberFilter(field_name='author_id')
     tags = django_filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags'
     )
     is_favorited = django_filters.ChoiceFilter(
         choices=CHOICES,
@@ -27,15 +36,36 @@ class RecipeFilter(django_filters.FilterSet):
         choices=CHOICES,
         method='filter_is_in_shopping_cart'
     )
+    search = django_filters.CharFilter(method='filter_search')
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        # EXISTS вместо JOIN: рецепт с несколькими тегами не
+        # размножается, и DISTINCT не нужен
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=value
+            )
+        ))
+
+    def filter_user_relation(self, queryset, model, value):
+        """Сужает выдачу по избранному/корзине текущего пользователя."""
         user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value == '1' else queryset
+        exists = Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
         if value == '0':
-            return Recipe.objects.exclude(recipe__user=user).all()
-        return Recipe.objects.filter(recipe__user=user).all()
+            return queryset.filter(~exists)
+        return queryset.filter(exists)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value == '0':
-            return Recipe.objects.exclude(recipe_sh__user=user).all()
-        return Recipe.objects.filter(recipe_sh__user=user).all()
+        return self.filter_user_relation(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        # полнотекстовый поиск по названию, ингредиентам и тексту,
+        # выдача по убыванию релевантности
+        return search_recipes(queryset, value)
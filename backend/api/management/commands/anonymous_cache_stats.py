@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.cache import cache_is_shared
+
+from api.cache import get_anonymous_cache_stats, reset_anonymous_cache_stats
+
+
+class Command(BaseCommand):
+    help = ('Показывает счётчики микрокеша ответов для анонимов: '
+            'попадания, устаревшие ответы и промахи. Счётчики лежат в '
+            'кеше по умолчанию, поэтому он должен быть общим с '
+            'веб-процессами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # у команды свой LocMemCache: счётчики веб-процессов не видны
+            raise CommandError(
+                'Кеш по умолчанию локален для процесса, счётчики '
+                'веб-процессов недоступны. Укажите общий кеш в '
+                'CACHE_BACKEND и CACHE_LOCATION.'
+            )
+        stats = get_anonymous_cache_stats()
+        total = sum(stats.values())
+        for status, value in stats.items():
+            share = value / total * 100 if total else 0
+            self.stdout.write(f'{status:<6}{value:>10}{share:>8.1f}%')
+        if options['reset']:
+            reset_anonymous_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены.'))
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timezone
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from recipes.models import Ingredient
+
+from api.benchmarks import get_benchmark_user, get_dataset_size, run_scenarios
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число SQL-запросов, p50/p95 времени ответа и размер '
+            'ответа для всех маршрутов API и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='перед замером заполнить базу данными')
+        parser.add_argument('--ingredients', default='./data/ingredients.json')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--favorites', type=int, default=300000)
+        parser.add_argument('--cart', type=int, default=100000)
+        parser.add_argument('--subscriptions', type=int, default=50000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--user', help='email пользователя для замеров')
+        parser.add_argument('--only', action='append',
+                            help='префикс имени сценария, можно повторять')
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument('--baseline',
+                            help='JSON прошлого прогона для сравнения')
+
+    def seed(self, options):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', file=options['ingredients'],
+                         stdout=self.stdout)
+        call_command(
+            'seed_fake_data',
+            users=options['users'],
+            recipes=options['recipes'],
+            favorites=options['favorites'],
+            cart=options['cart'],
+            subscriptions=options['subscriptions'],
+            seed=options['random_seed'],
+            stdout=self.stdout,
+        )
+
+    def load_baseline(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                results = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        return {
+            (result['name'], result['anonymous']): result
+            for result in results
+        }
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть больше нуля.')
+        baseline = (
+            self.load_baseline(options['baseline'])
+            if options['baseline'] else {}
+        )
+        if options['seed']:
+            self.seed(options)
+        user = get_benchmark_user(options['user'])
+        if user is None or not Ingredient.objects.exists():
+            raise CommandError('База пуста: запустите команду с --seed.')
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        self.stdout.write(f'{"сценарий":<45}{"код":>5}{"SQL":>6}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"байт":>10}')
+        results = []
+        for result in run_scenarios(user, options['repeat'], options['only']):
+            results.append(result)
+            name = result['name'] + (' (аноним)' if result['anonymous']
+                                     else '')
+            line = (f'{name:<45}{result["status"]:>5}{result["queries"]:>6}'
+                    f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                    f'{result["bytes"]:>10}')
+            previous = baseline.get((result['name'], result['anonymous']))
+            if previous is not None:
+                line += (f'  SQL {result["queries"] - previous["queries"]:+d}'
+                         f', p95 {result["p95_ms"] - previous["p95_ms"]:+.2f}')
+                if result['queries'] > previous['queries']:
+                    line = self.style.WARNING(line)
+            self.stdout.write(line)
+
+        if options['output']:
+            report = {
+                'started_at': started_at,
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'user': user.email,
+                'dataset': get_dataset_size(),
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
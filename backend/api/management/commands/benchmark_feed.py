@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Favorite, Tag
+from users.models import User
+
+from api.benchmarks import get_client, measure, testserver_settings
+
+FEED_FILTERS = (
+    '',
+    '?is_favorited=1',
+    '?is_favorited=0',
+    '?is_in_shopping_cart=1',
+    '?tags={tag}',
+    '?tags={tag}&tags={other_tag}',
+    '?tags={tag}&is_favorited=1',
+    '?author={author}',
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число запросов и время ответа ленты рецептов '
+            'с фильтрами и без них на текущей базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--user', help='email пользователя для ленты')
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            favorite = Favorite.objects.select_related('user').first()
+            user = favorite.user if favorite else User.objects.first()
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        return user
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if not slugs:
+            raise CommandError('В базе нет тегов.')
+        params = {
+            'tag': slugs[0],
+            'other_tag': slugs[-1],
+            'author': user.id,
+        }
+        client = get_client(user)
+        self.stdout.write(f'{"фильтр":<40}{"код":>5}{"SQL":>6}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"байт":>10}')
+        with testserver_settings():
+            for feed_filter in FEED_FILTERS:
+                query = feed_filter.format(**params)
+                separator = '&' if query else '?'
+                result = measure(
+                    client,
+                    f'/api/recipes/{query}{separator}limit={options["limit"]}',
+                    options['repeat']
+                )
+                self.stdout.write(
+                    f'{query or "(без фильтра)":<40}{result["status"]:>5}'
+                    f'{result["queries"]:>6}{result["p50_ms"]:>10}'
+                    f'{result["p95_ms"]:>10}{result["bytes"]:>10}'
+                )
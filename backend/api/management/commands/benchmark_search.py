@@ -0,0 +1,98 @@
+from urllib.parse import quote
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from recipes.fake_data import DISHES, STYLES
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+
+from api.benchmarks import get_client, measure, testserver_settings
+
+SEARCH_QUERIES = (
+    '{dish}',
+    '{dish} {style}',
+    '{ingredient}',
+    '{dish} {ingredient}',
+    '{prefix}',
+    'несуществующееслово',
+)
+SEARCH_FILTERS = (
+    '',
+    '&tags={tag}',
+    '&is_favorited=1',
+    '&author={author}',
+    '&pagination=cursor',
+)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет ?search= ленты рецептов отдельно и вместе с '
+            'фильтрами. С --seed сначала заполняет базу: по умолчанию '
+            'миллион рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='перед замером заполнить базу данными')
+        parser.add_argument('--ingredients', default='./data/ingredients.json')
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--favorites', type=int, default=1000000)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--limit', type=int, default=6)
+
+    def seed(self, options):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', file=options['ingredients'],
+                         stdout=self.stdout)
+        call_command(
+            'seed_fake_data',
+            users=options['users'],
+            recipes=options['recipes'],
+            favorites=options['favorites'],
+            cart=0,
+            subscriptions=0,
+            seed=options['random_seed'],
+            stdout=self.stdout,
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options)
+        favorite = Favorite.objects.select_related('user').first()
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        ingredient = (
+            Ingredient.objects.filter(ingredients_recipes__isnull=False)
+            .values_list('name', flat=True).first()
+        )
+        if favorite is None or tag is None or ingredient is None:
+            raise CommandError('База пуста: запустите команду с --seed.')
+        user = favorite.user
+        params = {
+            'dish': DISHES[0],
+            'style': STYLES[0],
+            'ingredient': ingredient,
+            'prefix': ingredient[:3],
+            'tag': tag,
+            'author': user.id,
+        }
+        client = get_client(user)
+        self.stdout.write(f'Рецептов в базе: {Recipe.objects.count()}')
+        self.stdout.write(f'{"запрос":<50}{"код":>5}{"SQL":>6}'
+                          f'{"p50, мс":>10}{"p95, мс":>10}{"байт":>10}')
+        with testserver_settings():
+            for search in SEARCH_QUERIES:
+                for search_filter in SEARCH_FILTERS:
+                    text = search.format(**params)
+                    query = f'?search={text}{search_filter.format(**params)}'
+                    result = measure(
+                        client,
+                        f'/api/recipes/?search={quote(text)}'
+                        f'{search_filter.format(**params)}'
+                        f'&limit={options["limit"]}',
+                        options['repeat']
+                    )
+                    self.stdout.write(
+                        f'{query:<50}{result["status"]:>5}'
+                        f'{result["queries"]:>6}{result["p50_ms"]:>10}'
+                        f'{result["p95_ms"]:>10}{result["bytes"]:>10}'
+                    )
@@ -0,0 +1,26 @@
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from api.exceptions import RequestEntityTooLargeException
+
+
+class LimitedJSONParser(JSONParser):
+    """JSONParser, отклоняющий тело больше JSON_BODY_MAX_SIZE до разбора."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        limit = settings.JSON_BODY_MAX_SIZE
+        request = parser_context['request']
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > limit:
+            raise RequestEntityTooLargeException()
+        # Content-Length может не быть (chunked) или он может не совпадать
+        # с телом: читаем не больше limit + 1 байт
+        body = stream.read(limit + 1)
+        if len(body) > limit:
+            raise RequestEntityTooLargeException()
+        return super().parse(BytesIO(body), media_type, parser_context)
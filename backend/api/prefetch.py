@@ -0,0 +1,204 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+class QueryPlan:
+    """select_related, prefetch_related и only() для выборки одной модели.
+
+    only равен None, если нужные поля вывести нельзя (свойство модели,
+    метод сериализатора без объявленных источников) - тогда модель
+    загружается целиком.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.select = set()
+        self.only = set()
+        self.prefetch = {}
+
+    def add_only(self, path):
+        if self.only is not None:
+            self.only.add(path)
+
+    def apply(self, queryset, querysets=None, lookup_prefix=''):
+        """Применяет план к queryset.
+
+        querysets задаёт базовые выборки для отдельных prefetch-путей,
+        например рецепты с ограничением recipes_limit.
+        """
+        querysets = querysets or {}
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        for lookup, plan in self.prefetch.items():
+            path = lookup_prefix + lookup
+            base = querysets.get(path, plan.model._default_manager.all())
+            queryset = queryset.prefetch_related(Prefetch(
+                lookup, queryset=plan.apply(base, querysets, f'{path}__')
+            ))
+        if self.only is not None:
+            queryset = queryset.only(*sorted(self.only) or ('pk',))
+        return queryset
+
+    def lookups(self, querysets=None):
+        """Пути для prefetch_related_objects по уже загруженным объектам."""
+        querysets = querysets or {}
+        lookups = sorted(self.select, key=len)
+        for lookup, plan in self.prefetch.items():
+            base = querysets.get(lookup, plan.model._default_manager.all())
+            lookups.append(Prefetch(
+                lookup, queryset=plan.apply(base, querysets, f'{lookup}__')
+            ))
+        return lookups
+
+
+def get_method_field_sources(serializer):
+    """Объявленные поля модели для SerializerMethodField.
+
+    Сериализаторы и их примеси описывают их в method_field_sources:
+    {'имя поля': ('поле модели', ...)}.
+    """
+    sources = {}
+    for klass in reversed(type(serializer).__mro__):
+        sources.update(vars(klass).get('method_field_sources', {}))
+    return sources
+
+
+def get_nested(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def plan_serializer(plan, serializer, model, prefix=''):
+    """Дополняет план полями сериализатора, читаемыми из model."""
+    serializer = get_nested(serializer) or serializer
+    method_sources = get_method_field_sources(serializer)
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            nested = get_nested(field)
+            if nested is not None:
+                plan_serializer(plan, nested, model, prefix)
+            elif field.field_name in method_sources:
+                for source in method_sources[field.field_name]:
+                    plan_path(plan, model, prefix, source.split('.'))
+            else:
+                plan.only = None
+            continue
+        plan_path(plan, model, prefix, field.source_attrs, field)
+
+
+def plan_select(plan, lookup, rest, field):
+    """FK или OneToOne этой модели: в only() и select_related.
+
+    Возвращает True, если путь продолжается в связанной модели.
+    """
+    plan.add_only(lookup)
+    if not rest and isinstance(field, RelatedField):
+        # PrimaryKeyRelatedField читает только id из самой строки
+        if not field.use_pk_only_optimization():
+            plan.select.add(lookup)
+            plan.only = None
+        return False
+    plan.select.add(lookup)
+    return True
+
+
+def plan_prefetch(plan, model_field, lookup, rest, field):
+    """Обратная или M2M связь: prefetch_related со своим планом."""
+    related = model_field.related_model
+    child = plan.prefetch.setdefault(lookup, QueryPlan(related))
+    if model_field.one_to_many or model_field.one_to_one:
+        # обратная связь: prefetch сопоставляет строки по FK
+        child.add_only(model_field.field.name)
+    if rest:
+        plan_path(child, related, '', rest, field)
+    elif get_nested(field) is not None:
+        plan_serializer(child, get_nested(field), related)
+    elif not isinstance(field, ManyRelatedField):
+        child.only = None
+
+
+def plan_path(plan, model, prefix, attrs, field=None):
+    """Разбирает путь source: FK - в select_related, обратные и M2M
+    связи - в prefetch_related со своим планом, поля - в only()."""
+    for index, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # свойство или метод модели: какие поля оно читает, неизвестно
+            plan.only = None
+            return
+        if not model_field.is_relation:
+            plan.add_only(prefix + attr)
+            return
+        rest = attrs[index + 1:]
+        if not (model_field.many_to_one or (
+            model_field.one_to_one and model_field.concrete
+        )):
+            plan_prefetch(plan, model_field, prefix + attr, rest, field)
+            return
+        if not plan_select(plan, prefix + attr, rest, field):
+            return
+        model = model_field.related_model
+        prefix = f'{prefix}{attr}__'
+    nested = get_nested(field)
+    if nested is not None:
+        plan_serializer(plan, nested, model, prefix)
+    elif field is not None:
+        plan.only = None
+
+
+def get_query_plan(serializer, model):
+    plan = QueryPlan(model)
+    plan_serializer(plan, serializer, model)
+    return plan
+
+
+def optimize_queryset(queryset, serializer, querysets=None):
+    """Добавляет к queryset всё, что сериализатору нужно без N+1."""
+    return get_query_plan(serializer, queryset.model).apply(
+        queryset, querysets
+    )
+
+
+def prefetch_for(instances, serializer, querysets=None):
+    """То же для уже загруженных объектов, например только что созданных."""
+    if not instances:
+        return
+    plan = get_query_plan(serializer, type(instances[0]))
+    prefetch_related_objects(instances, *plan.lookups(querysets))
+
+
+class QueryPlanMixin:
+    """Строит select_related/prefetch_related/only() queryset по полям
+    сериализатора действия, так что новые поля не дают N+1.
+
+    get_prefetch_querysets может задать базовые выборки для отдельных
+    prefetch-путей.
+    """
+
+    def get_prefetch_querysets(self):
+        return {}
+
+    def get_plan_serializer(self):
+        """Сериализатор, по полям которого строится план; None - без плана."""
+        if self.action == 'destroy':
+            return None
+        return self.get_serializer_class()(
+            context=self.get_serializer_context()
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer = self.get_plan_serializer()
+        if serializer is None:
+            return queryset
+        return optimize_queryset(
+            queryset, serializer, self.get_prefetch_querysets()
+        )
@@ -0,0 +1,216 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SQL_LOG_LENGTH = 300
+SAVEPOINT_STATEMENTS = ('SAVEPOINT ', 'RELEASE SAVEPOINT ',
+                        'ROLLBACK TO SAVEPOINT ')
+
+
+def is_savepoint(sql):
+    """SAVEPOINT вложенного atomic, а не запрос к данным.
+
+    Их число зависит от того, открыта ли уже внешняя транзакция - в
+    тестах и откатываемых сценариях benchmark_api она есть, в обычном
+    запросе нет, - поэтому в счёт запросов они не входят.
+    """
+    return sql.startswith(SAVEPOINT_STATEMENTS)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше запросов, чем ему отведено."""
+
+
+class QueryCollector:
+    """Считает запросы, время в БД и повторы одного и того же SQL.
+
+    Подключается через execute_wrapper и не требует DEBUG. Текст SQL
+    приходит с плейсхолдерами, без параметров, поэтому однотипные
+    запросы с разными id - сигнатура N+1 - совпадают. SAVEPOINT не
+    считаются, см. is_savepoint.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            if not is_savepoint(sql):
+                self.count += 1
+                self.statements[sql] += 1
+
+    @contextmanager
+    def collect(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self)
+                )
+            yield self
+
+    def duplicates(self, threshold=None):
+        threshold = threshold or settings.REQUEST_PROFILING_DUPLICATE_THRESHOLD
+        return [
+            {'sql': sql[:SQL_LOG_LENGTH], 'count': count}
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+@contextmanager
+def query_budget(limit):
+    """Для тестов: падает, если блок выполнил больше limit запросов."""
+    collector = QueryCollector()
+    with collector.collect():
+        yield collector
+    if collector.count > limit:
+        raise QueryBudgetExceeded(
+            f'{collector.count} запросов при бюджете {limit}; '
+            f'повторы: {collector.duplicates()}'
+        )
+
+
+class RequestProfile:
+    """Профиль одного запроса; доступен представлениям как request.profile."""
+
+    def __init__(self):
+        self.queries = QueryCollector()
+        self.view = None
+        self.budget = None
+        self.serializer_time = 0.0
+        self.serializer_queries = 0
+
+    def set_view(self, request, view_func):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is None:
+            self.view = view_func.__name__
+            return
+        action = (getattr(view_func, 'actions', None) or {}).get(
+            request.method.lower()
+        )
+        self.view = '.'.join(filter(None, (view_class.__name__, action)))
+        budget = getattr(view_class, 'query_budget', None)
+        self.budget = (
+            budget.get(action) if isinstance(budget, dict) else budget
+        )
+
+    def track_serializer(self, serializer):
+        """Засекает время и запросы to_representation сериализатора."""
+        to_representation = serializer.to_representation
+
+        def timed(instance):
+            started = time.perf_counter()
+            queries = self.queries.count
+            try:
+                return to_representation(instance)
+            finally:
+                self.serializer_time += time.perf_counter() - started
+                self.serializer_queries += self.queries.count - queries
+
+        serializer.to_representation = timed
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries.count > self.budget
+
+
+class ProfilingMixin:
+    """Хук DRF: добавляет в профиль запроса время сериализации."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        profile = getattr(self.request, 'profile', None)
+        if profile is not None:
+            profile.track_serializer(serializer)
+        return serializer
+
+
+class RequestProfilingMiddleware:
+    """Число запросов, время в БД, сериализации и размер ответа.
+
+    Профилируется доля запросов REQUEST_PROFILING_SAMPLE_RATE. Итоги
+    пишутся строкой JSON в лог, а при DEBUG или для персонала - ещё и в
+    заголовок Server-Timing; повторы одного SQL и превышение
+    query_budget представления - с уровнем WARNING, а при
+    REQUEST_PROFILING_STRICT превышение бюджета поднимает
+    QueryBudgetExceeded. Запросы, выполненные при отдаче потокового
+    ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = request.profile = RequestProfile()
+        started = time.perf_counter()
+        with profile.queries.collect():
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        if self.show_server_timing(request):
+            response['Server-Timing'] = self.server_timing(profile, total)
+        self.log(request, response, profile, total)
+        if profile.over_budget and settings.REQUEST_PROFILING_STRICT:
+            raise QueryBudgetExceeded(
+                f'{profile.view}: {profile.queries.count} запросов '
+                f'при бюджете {profile.budget}'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            profile.set_view(request, view_func)
+
+    def show_server_timing(self, request):
+        # время в БД и число запросов раскрывают устройство сервера:
+        # заголовок видят только разработчики и персонал
+        if not settings.REQUEST_PROFILING_SERVER_TIMING:
+            return False
+        user = getattr(request, 'user', None)
+        return settings.DEBUG or bool(user and user.is_staff)
+
+    def server_timing(self, profile, total):
+        return ', '.join((
+            f'db;dur={profile.queries.duration * 1000:.2f};'
+            f'desc="{profile.queries.count} queries"',
+            f'serializer;dur={profile.serializer_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ))
+
+    def log(self, request, response, profile, total):
+        duplicates = profile.queries.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': profile.view,
+            'status': response.status_code,
+            'queries': profile.queries.count,
+            'budget': profile.budget,
+            'db_ms': round(profile.queries.duration * 1000, 2),
+            'serializer_ms': round(profile.serializer_time * 1000, 2),
+            'serializer_queries': profile.serializer_queries,
+            'total_ms': round(total * 1000, 2),
+            'bytes': None if response.streaming else len(response.content),
+            'duplicates': duplicates,
+        }
+        logger.log(
+            logging.WARNING if duplicates or profile.over_budget
+            else logging.INFO,
+            json.dumps(record, ensure_ascii=False)
+        )
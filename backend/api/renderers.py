@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+SHOPPING_CART_TITLE = 'Shopping_cart:'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    stream() принимает итератор строк агрегата ингредиентов и отдаёт
+    содержимое файла частями для StreamingHttpResponse. render()
+    используется DRF только для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    @staticmethod
+    def get_name(ingredient):
+        return ingredient['ingredient__name'].capitalize()
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        yield SHOPPING_CART_TITLE + '\n\n'
+        for counter, ingredient in enumerate(ingredients, 1):
+            yield (f'{counter}.'
+                   f'{self.get_name(ingredient)} '
+                   f"({ingredient['ingredient__measurement_unit']})"
+                   f" - {ingredient['amount']} \n")
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            yield writer.writerow((
+                self.get_name(ingredient),
+                ingredient['ingredient__measurement_unit'],
+                ingredient['amount'],
+            ))
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        yield '['
+        separator = ''
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': self.get_name(ingredient),
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['amount'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+
+class ShoppingCartPDFRenderer(ShoppingCartRenderer):
+    """PDF собирается в памяти: формат не допускает потоковой записи."""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingCartFont'
+    chunk_size = 64 * 1024
+
+    def get_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        if not os.path.exists(settings.SHOPPING_CART_PDF_FONT):
+            return 'Helvetica'
+        pdfmetrics.registerFont(
+            TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+        )
+        return self.font_name
+
+    def stream(self, ingredients):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        height = A4[1]
+        text = pdf.beginText(40, height - 50)
+        text.setFont(font, 14)
+        text.textLine(SHOPPING_CART_TITLE)
+        text.setFont(font, 11)
+        for counter, ingredient in enumerate(ingredients, 1):
+            if text.getY() < 50:
+                pdf.drawText(text)
+                pdf.showPage()
+                text = pdf.beginText(40, height - 50)
+                text.setFont(font, 11)
+            text.textLine(
+                f'{counter}. {self.get_name(ingredient)} '
+                f"({ingredient['ingredient__measurement_unit']})"
+                f" - {ingredient['amount']}"
+            )
+        pdf.drawText(text)
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+
+SHOPPING_CART_RENDERERS = (
+    ShoppingCartTextRenderer,
+    ShoppingCartCSVRenderer,
+    ShoppingCartJSONRenderer,
+    ShoppingCartPDFRenderer,
+)
@@ -1,19 +1,39 @@
-from django.db.models import Count, F, Prefetch
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from recipes.images import variants_are_current
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.shopping_list import change_recipe
 from rest_framework import serializers
 from users.models import Subscription, User
 
+from api.cache import RecipeFragmentCacheMixin, RecipeFragmentListSerializer
+from api.fields import Base64ImageField, BulkPrimaryKeyRelatedField
+from api.prefetch import prefetch_for
+
 
 class GetIsSubscribedMixin:
+    method_field_sources = {'is_subscribed': ()}
+
+    def get_subscriptions(self):
+        """Id авторов, на которых подписан пользователь; один запрос на
+        весь запрос API, результат хранится в общем контексте."""
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is None:
+            user = self.context.get('request').user
+            subscriptions = frozenset(
+                () if user.is_anonymous
+                else user.subscriber.values_list('author_id', flat=True)
+            )
+            self.context['subscriptions'] = subscriptions
+        return subscriptions
+
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.subscriber.filter(author=obj.id).exists()
+        return obj.id in self.get_subscriptions()
 
 
 class CustomUserSerializer(GetIsSubscribedMixin, UserSerializer):
@@ -53,13 +73,45 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class TagsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
 
 
-class RecipesSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin:
+    method_field_sources = {'image_variants': ('image', 'image_variants')}
+
+    def get_image_variants(self, obj):
+        """Ссылки на уменьшенные копии; пока они не готовы - на оригинал."""
+        request = self.context.get('request')
+        current = variants_are_current(obj)
+        urls = {}
+        for variant in settings.RECIPE_IMAGE_VARIANTS:
+            name = current and obj.image_variants.get(variant)
+            if name:
+                url = default_storage.url(name)
+            else:
+                url = obj.image.url if obj.image else None
+            if url and request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant] = url
+        return urls
+
+
+class RecipesSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     tags = TagsSerializer(many=True)
     ingredients = IngredientRecipeSerializer(source='ingredients_recipes',
                                              many=True)
@@ -67,8 +119,11 @@ class RecipesSerializer(serializers.ModelSerializer):
     image = Base64ImageField(
         required=False, allow_null=True
     )
+    image_variants = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    # флаги приходят аннотациями из RecipesViewSet.get_queryset
+    method_field_sources = {'is_favorited': (), 'is_in_shopping_cart': ()}
 
     class Meta:
         model = Recipe
@@ -81,11 +136,15 @@ class RecipesSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
     def get_is_favorited(self, obj):
+        annotated = getattr(obj, 'is_favorited', None)
+        if annotated is not None:
+            return annotated
         return (self.context.get('request').user.is_authenticated
                 and Favorite.objects.filter(
                     user=self.context.get('request').user,
@@ -93,6 +152,9 @@ class RecipesSerializer(serializers.ModelSerializer):
         ).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        annotated = getattr(obj, 'is_in_shopping_cart', None)
+        if annotated is not None:
+            return annotated
         return (self.context.get('request').user.is_authenticated
                 and ShoppingCart.objects.filter(
                     user=self.context.get('request').user,
@@ -100,11 +162,17 @@ class RecipesSerializer(serializers.ModelSerializer):
         ).exists())
 
 
+class CachedRecipesSerializer(RecipeFragmentCacheMixin, RecipesSerializer):
+
+    class Meta(RecipesSerializer.Meta):
+        list_serializer_class = RecipeFragmentListSerializer
+
+
 class RecipeMinifiedSerializer(RecipesSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class GetIngredientsMixin:
@@ -116,66 +184,113 @@ class GetIngredientsMixin:
         )
 
 
-class RecipesPostSerializer(GetIngredientsMixin, serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+class RecipesPostSerializer(GetIngredientsMixin, ImageVariantsMixin,
+                            serializers.ModelSerializer):
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
     ingredients = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = (
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'name',
+            'image',
+            'image_variants',
+            'text',
+            'cooking_time',
+            'pub_date',
+        )
         read_only_fields = ('author',)
 
     def validate_tags(self, tags):
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    'Повтор тега'
-                )
-            tags_list.append(tag)
-            if len(tags_list) < 1:
-                raise serializers.ValidationError(
-                    'Выберите тег'
-                )
+        if not tags:
+            raise serializers.ValidationError(
+                'Выберите тег'
+            )
+        if len({tag.id for tag in tags}) != len(tags):
+            raise serializers.ValidationError(
+                'Повтор тега'
+            )
         return tags
 
+    def check_ingredient(self, item, ids):
+        """Проверяет одну позицию без запросов к БД.
+
+        Возвращает id ингредиента и словарь ошибок позиции; id
+        добавляется в ids для проверки повторов.
+        """
+        if not isinstance(item, dict):
+            return None, {
+                'non_field_errors': 'Ожидается объект с полями id и amount.'
+            }
+        errors = {}
+        ingredient_id = None
+        try:
+            ingredient_id = int(item['id'])
+        except (KeyError, TypeError, ValueError):
+            errors['id'] = 'Укажите id ингредиента.'
+        else:
+            if ingredient_id in ids:
+                errors['id'] = 'Ингредиент не должен повторяться.'
+            ids.add(ingredient_id)
+        try:
+            if int(item.get('amount')) < 1:
+                errors['amount'] = 'Минимальное количество = 1'
+        except (TypeError, ValueError):
+            errors['amount'] = 'Укажите количество.'
+        return ingredient_id, errors
+
+    def check_ingredients(self, ingredients):
+        """Проверяет ингредиенты одним запросом к БД.
+
+        Ошибки возвращаются списком по позициям, как у вложенных
+        сериализаторов DRF: пустой словарь для корректной позиции.
+        """
+        if not ingredients or not isinstance(ingredients, list):
+            raise serializers.ValidationError({
+                'ingredients': 'Минимально должен быть 1 ингредиент.'
+            })
+        ids = set()
+        checked = [self.check_ingredient(item, ids) for item in ingredients]
+        existing = Ingredient.objects.only('id').in_bulk(ids)
+        for ingredient_id, item_errors in checked:
+            if not item_errors.keys() & {'id', 'non_field_errors'} and (
+                ingredient_id not in existing
+            ):
+                item_errors['id'] = (
+                    f'Ингредиента с id={ingredient_id} не существует.'
+                )
+        errors = [item_errors for _, item_errors in checked]
+        if any(errors):
+            raise serializers.ValidationError({'ingredients': errors})
+        return ingredients
+
     def validate(self, data):
         name = data.get('name')
-        if len(name) < 2:
+        if name is not None and len(name) < 2:
             raise serializers.ValidationError({
                 'name': 'Название рецепта минимум 2 символа'})
-        ingredients = self.initial_data['ingredients']
-        ingredient_list = []
-        if not ingredients:
-            raise serializers.ValidationError(
-                'Минимально должен быть 1 ингредиент.'
-            )
-        for item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=item['id']
+        # PATCH без ingredients оставляет ингредиенты рецепта как есть
+        if not self.partial or 'ingredients' in self.initial_data:
+            data['ingredients'] = self.check_ingredients(
+                self.initial_data.get('ingredients')
             )
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингредиент не должен повторяться.'
-                )
-            if int(item.get('amount')) < 1:
-                raise serializers.ValidationError(
-                    'Минимальное количество = 1'
-                )
-            ingredient_list.append(ingredient)
-        data['ingredients'] = ingredients
         return data
 
     def add_ingredients_and_tags(self, instance, **validate_data):
         ingredients = validate_data['ingredients']
         tags = validate_data['tags']
-        for tag in tags:
-            instance.tags.add(tag)
-
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=instance, tag=tag) for tag in tags
+        ])
         IngredientRecipe.objects.bulk_create([
             IngredientRecipe(
                 recipe=instance,
@@ -185,6 +300,7 @@ class RecipesPostSerializer(GetIngredientsMixin, serializers.ModelSerializer):
         ])
         return instance
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -193,19 +309,72 @@ class RecipesPostSerializer(GetIngredientsMixin, serializers.ModelSerializer):
             recipe, ingredients=ingredients, tags=tags
         )
 
+    def update_tags(self, instance, tags):
+        current = {tag.id for tag in instance.tags.all()}
+        new = {tag.id for tag in tags}
+        if current - new:
+            instance.tags.remove(*(current - new))
+        if new - current:
+            instance.tags.add(*(new - current))
+
+    def update_ingredients(self, instance, ingredients):
+        """Меняет только добавленные, удалённые и изменённые строки."""
+        amounts = {
+            int(item['id']): int(item['amount']) for item in ingredients
+        }
+        current = {
+            row.ingredient_id: row
+            for row in instance.ingredients_recipes.all()
+        }
+        deltas = {
+            ingredient_id: amounts.get(ingredient_id, 0) - (
+                current[ingredient_id].amount if ingredient_id in current
+                else 0
+            )
+            for ingredient_id in amounts.keys() | current.keys()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=instance, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        added = amounts.keys() - current.keys()
+        if added:
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe=instance,
+                    ingredient_id=ingredient_id,
+                    amount=amounts[ingredient_id]
+                ) for ingredient_id in added
+            ])
+        # списки покупок тех, у кого рецепт в корзине
+        change_recipe(instance.pk, deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance = self.add_ingredients_and_tags(
-            instance, ingredients=ingredients, tags=tags)
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # только изменённые поля: счётчики двигают параллельные запросы
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 
 class SubscriptionSerializer(CustomUserSerializer):
     recipes = RecipeMinifiedSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -223,13 +392,12 @@ class SubscriptionSerializer(CustomUserSerializer):
     def get_is_subscribed(*args):
         return True
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
+    author = SubscriptionSerializer(read_only=True)
+
     class Meta:
-        fields = ()  # python пишет, что поле должно быть
+        fields = ('author',)
         model = Subscription
 
     def validate(self, data):
@@ -249,28 +417,23 @@ class SubscribeSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Вы уже подписаны на этого автора!'
                 )
+        data['author'] = author
         return data
 
     def to_representation(self, instance):
-        user_query = User.objects.all().annotate(
-            recipes_count=Count("recipes")
-        )
-        sub_query = Subscription.objects.select_related(
-            'subscriber').prefetch_related(
-                Prefetch("author", queryset=user_query)
-        )
-        instance = get_object_or_404(
-            sub_query, subscriber=instance.subscriber, author=instance.author
+        # автора уже загрузил validate, остаётся подгрузить его рецепты
+        prefetch_for(
+            [instance], self,
+            self.context.get('view').get_prefetch_querysets()
         )
-        serializer = SubscriptionSerializer(instance.author,
-                                            context=self.context)
-        return serializer.data
+        return super().to_representation(instance)['author']
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
+    recipe = RecipeMinifiedSerializer(read_only=True)
 
     class Meta:
-        fields = ()
+        fields = ('recipe',)
         model = Favorite
 
     def validate(self, data):
@@ -285,17 +448,18 @@ class FavoriteSerializer(serializers.ModelSerializer):
                                         user=user).exists()):
             raise serializers.ValidationError(
                 'Этот рецепт уже есть в избранном!')
+        data['recipe'] = recipe
         return data
 
     def to_representation(self, instance):
-        serializer = RecipeMinifiedSerializer(instance.recipe)
-        return serializer.data
+        return super().to_representation(instance)['recipe']
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
+    recipe = RecipeMinifiedSerializer(read_only=True)
 
     class Meta:
-        fields = ()
+        fields = ('recipe',)
         model = ShoppingCart
 
     def validate(self, data):
@@ -310,8 +474,8 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
                                             user=user).exists()):
             raise serializers.ValidationError(
                 'Этот рецепт уже есть в списке покупок!')
+        data['recipe'] = recipe
         return data
 
     def to_representation(self, instance):
-        serializer = RecipeMinifiedSerializer(instance.recipe)
-        return serializer.data
+        return super().to_representation(instance)['recipe']
@@ -0,0 +1,401 @@
+import base64
+from collections import Counter
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from rest_framework.test import APIClient
+from users.models import Subscription, User
+
+from api.profiling import QueryBudgetExceeded
+from api.serializers import RecipesPostSerializer
+from api.views import RecipesViewSet
+
+IMAGE = 'recipes/images/test.png'
+
+
+def image_data_uri():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), '#E26C2D').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}', email=f'user{number}@example.org',
+        password='salt-and-pepper-42', first_name='Имя', last_name='Фамилия'
+    )
+
+
+def create_recipes(authors, tags, ingredients, count):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=authors[number % len(authors)], name=f'Рецепт {number}',
+            text='Описание', cooking_time=10, image=IMAGE
+        )
+        recipe.tags.set(tags[:1 + number % len(tags)])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=number + 1)
+            for ingredient in ingredients[number % 2::2]
+        ])
+        recipes.append(recipe)
+    return recipes
+
+
+# каждый запрос профилируется, превышение query_budget - исключение
+@override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0,
+                   REQUEST_PROFILING_STRICT=True)
+class QueryCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.authors = [create_user(number) for number in range(1, 4)]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}',
+                               color=f'#00000{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+        cls.recipes = create_recipes(
+            [cls.user, *cls.authors], cls.tags, cls.ingredients, 25
+        )
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(subscriber=cls.user,
+                                    author=cls.authors[0])
+        Subscription.objects.create(subscriber=cls.user,
+                                    author=cls.authors[1])
+
+    def setUp(self):
+        # холодные кеши ответов и фрагментов: замеряется полный путь
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RecipeListQueriesTest(QueryCountTestCase):
+    """Число запросов ленты рецептов не зависит от размера страницы."""
+
+    def assert_page_queries(self, client, queries):
+        for limit in (6, 20):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_page_queries(self.anonymous, 5)
+
+    def test_authenticated(self):
+        self.assert_page_queries(self.client, 7)
+
+    def test_vary(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            {header.strip() for header in response['Vary'].split(',')}
+            & {'Authorization', 'Cookie'}, {'Authorization', 'Cookie'}
+        )
+
+    def test_flags(self):
+        response = self.client.get('/api/recipes/?limit=25')
+        recipes = {
+            recipe['id']: recipe for recipe in response.json()['results']
+        }
+        for recipe in self.recipes:
+            with self.subTest(recipe=recipe.id):
+                self.assertEqual(recipes[recipe.id]['is_favorited'],
+                                 recipe in self.recipes[::2])
+                self.assertEqual(recipes[recipe.id]['is_in_shopping_cart'],
+                                 recipe in self.recipes[::3])
+
+
+class SubscribeQueriesTest(QueryCountTestCase):
+    """Подписка, отписка и список подписок за постоянное число запросов."""
+
+    def test_subscribe(self):
+        author = self.authors[2]
+        with self.assertNumQueries(4):
+            response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['recipes_count'],
+                         author.recipes.count())
+        self.assertTrue(Subscription.objects.filter(
+            subscriber=self.user, author=author
+        ).exists())
+
+    def test_unsubscribe(self):
+        author = self.authors[0]
+        with self.assertNumQueries(2):
+            response = self.client.delete(
+                f'/api/users/{author.id}/subscribe/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Subscription.objects.filter(
+            subscriber=self.user, author=author
+        ).exists())
+
+    def test_subscriptions(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=2'
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 2)
+        for author in results:
+            self.assertLessEqual(len(author['recipes']), 2)
+
+
+class CountersTest(QueryCountTestCase):
+    """Правка рецепта или пользователя не затирает счётчики."""
+
+    def test_recipe_edit(self):
+        # PATCH, прочитавший рецепт до чужих добавлений в избранное
+        recipe = self.recipes[0]
+        stale = Recipe.objects.get(pk=recipe.pk)
+        other = APIClient()
+        other.force_authenticate(self.authors[0])
+        other.post(f'/api/recipes/{recipe.id}/favorite/')
+        other.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        serializer = RecipesPostSerializer(
+            stale, data={'name': 'Новое имя'}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое имя')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (2, 2)
+        )
+
+    def test_stale_recipe_save(self):
+        recipe = Recipe.objects.get(pk=self.recipes[1].pk)
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        recipe.name = 'Новое имя'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое имя')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+
+    def test_set_password(self):
+        author = self.authors[2]
+        recipes_count = author.recipes.count()
+        stale = User.objects.get(pk=author.pk)
+        create_recipes([author], self.tags, self.ingredients, 1)
+        client = APIClient()
+        client.force_authenticate(stale)
+        response = client.post('/api/users/set_password/', {
+            'current_password': 'salt-and-pepper-42',
+            'new_password': 'pepper-and-salt-43',
+        }, format='json')
+        self.assertEqual(response.status_code, 204)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, recipes_count + 1)
+        self.assertTrue(author.check_password('pepper-and-salt-43'))
+
+
+class ShoppingListTest(QueryCountTestCase):
+    """Список покупок совпадает с суммой ингредиентов рецептов в корзине."""
+
+    def setUp(self):
+        super().setUp()
+        self.other = APIClient()
+        self.other.force_authenticate(self.authors[0])
+        self.other.post(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+
+    def assert_in_step(self):
+        for user in (self.user, self.authors[0]):
+            expected = Counter()
+            for ingredient_id, amount in IngredientRecipe.objects.filter(
+                recipe__in=ShoppingCart.objects.filter(
+                    user=user
+                ).values('recipe')
+            ).values_list('ingredient_id', 'amount'):
+                expected[ingredient_id] += amount
+            with self.subTest(user=user.id):
+                self.assertEqual(dict(ShoppingListItem.objects.filter(
+                    user=user
+                ).values_list('ingredient_id', 'amount')), dict(expected))
+
+    def test_cart_add_remove(self):
+        recipe = self.recipes[1]
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        self.assert_in_step()
+        response = self.client.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_in_step()
+
+    def test_ingredients_edit(self):
+        # убран ингредиент, изменено количество и добавлен новый
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/', {'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 5},
+                {'id': self.ingredients[1].id, 'amount': 3},
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_in_step()
+
+    def test_recipe_delete(self):
+        response = self.client.delete(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_in_step()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.authors[0]
+        ).exists())
+
+
+class RecipeWriteQueriesTest(QueryCountTestCase):
+    """Число запросов создания и правки рецепта не зависит от числа
+    тегов и ингредиентов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media.name)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        cls.media.cleanup()
+        super().tearDownClass()
+
+    def payload(self, tags, ingredients):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_data_uri(),
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_create_tags(self):
+        for tags in (self.tags[:1], self.tags):
+            with self.subTest(tags=len(tags)):
+                with self.assertNumQueries(10):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        self.payload(tags, self.ingredients[:2]),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.json()['tags']), len(tags))
+
+    def test_create_ingredients(self):
+        for ingredients in (self.ingredients[:1], self.ingredients):
+            with self.subTest(ingredients=len(ingredients)):
+                with self.assertNumQueries(10):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        self.payload(self.tags[:1], ingredients),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.json()['ingredients']),
+                                 len(ingredients))
+
+    def test_update_ingredients(self):
+        # рецепт в корзине: один ингредиент меняется, два удаляются,
+        # два добавляются, разница уходит в список покупок
+        recipe = self.recipes[0]
+        with self.assertNumQueries(17):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {'ingredients': [
+                    {'id': ingredient.id, 'amount': 7}
+                    for ingredient in self.ingredients[:2]
+                    + self.ingredients[3:4]
+                ]}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['ingredients']), 3)
+
+    def test_unknown_tag(self):
+        response = self.client.post(
+            '/api/recipes/',
+            {**self.payload(self.tags[:1], self.ingredients[:2]),
+             'tags': [self.tags[0].id, 0]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.json())
+
+
+class QueryBudgetTest(QueryCountTestCase):
+    """Действия с query_budget, которые не покрыты другими тестами."""
+
+    def test_read_actions(self):
+        for path in (
+            f'/api/recipes/{self.recipes[0].id}/',
+            '/api/recipes/download_shopping_cart/',
+            '/api/recipes/shopping_cart_summary/',
+            '/api/users/subscriptions/',
+            '/api/tags/',
+            '/api/ingredients/',
+            '/api/ingredients/autocomplete/?name=инг',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_write_actions(self):
+        recipe = self.recipes[1]
+        for relation in ('favorite', 'shopping_cart'):
+            with self.subTest(relation=relation):
+                path = f'/api/recipes/{recipe.id}/{relation}/'
+                self.assertEqual(self.client.post(path).status_code, 201)
+                self.assertEqual(self.client.delete(path).status_code, 204)
+        response = self.client.delete(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_exceeded(self):
+        with mock.patch.object(RecipesViewSet, 'query_budget', {'list': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/recipes/')
+
+
+class ServerTimingTest(QueryCountTestCase):
+    """Server-Timing видят только персонал и DEBUG."""
+
+    def test_hidden(self):
+        for client in (self.anonymous, self.client):
+            response = client.get('/api/tags/')
+            self.assertNotIn('Server-Timing', response)
+
+    def test_staff(self):
+        self.user.is_staff = True
+        self.client.force_authenticate(self.user)
+        self.assertIn('Server-Timing', self.client.get('/api/tags/'))
+
+    @override_settings(DEBUG=True)
+    def test_debug(self):
+        self.assertIn('Server-Timing', self.anonymous.get('/api/tags/'))
@@ -1,55 +1,157 @@
-from core.utils import preparation_file
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
-from django.http.response import FileResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.autocomplete import autocomplete
+from recipes.cache import get_catalogue_version, get_recipes_version
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.pagination import _positive_int
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from users.models import Subscription
 
+from api.cache import (AnonymousCacheMixin, CatalogueCacheMixin,
+                       CatalogueConditionalGetMixin, ConditionalGetMixin,
+                       get_user_state, make_etag)
 from api.exceptions import BadRequestException
-from api.serializers import (FavoriteSerializer, IngredientsSerializer,
-                             RecipesPostSerializer, RecipesSerializer,
-                             ShoppingCartSerializer, SubscribeSerializer,
+from api.pagination import FeedPagination
+from api.prefetch import QueryPlanMixin, optimize_queryset
+from api.profiling import ProfilingMixin
+from api.renderers import SHOPPING_CART_RENDERERS
+from api.serializers import (CachedRecipesSerializer, FavoriteSerializer,
+                             IngredientsSerializer, RecipesPostSerializer,
+                             RecipesSerializer, ShoppingCartSerializer,
+                             ShoppingListItemSerializer, SubscribeSerializer,
                              SubscriptionSerializer, TagsSerializer)
-from api.viewsets import CreateDestroyViewSet, ListViewSet
+from api.viewsets import (CreateDestroyViewSet, ListViewSet,
+                          RecipesLimitMixin)
 
 from .filters import IngredientFilter, RecipeFilter
 
 User = get_user_model()
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ProfilingMixin, CatalogueConditionalGetMixin,
+                         CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
     ordering = ('name',)
+    query_budget = 2
 
+    @action(detail=False, methods=['get'], filter_backends=(),
+            url_path='autocomplete')
+    def autocomplete(self, request):
+        """Подсказки по префиксу названия, не больше limit штук."""
+        prefix = request.query_params.get('name', '').strip()
+        try:
+            limit = _positive_int(
+                request.query_params.get(
+                    'limit', settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+                ),
+                strict=True,
+                cutoff=settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT
+            )
+        except ValueError:
+            limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        if not prefix:
+            return Response([])
+        return Response(autocomplete(prefix, limit))
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagsViewSet(ProfilingMixin, CatalogueConditionalGetMixin,
+                  CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
     pagination_class = None
     ordering = ('name',)
+    query_budget = 2
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Recipe.objects.select_related("author")
-        .prefetch_related('tags', 'ingredients_recipes')
-        .all()
-    )
+class RecipesViewSet(ProfilingMixin, QueryPlanMixin, AnonymousCacheMixin,
+                     ConditionalGetMixin, viewsets.ModelViewSet):
+    # select_related/prefetch_related/only() строит QueryPlanMixin
+    queryset = Recipe.objects.all()
     serializer_class = RecipesSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = FeedPagination
     ordering = ('-pub_date',)
+    keyset_ordering = ('-pub_date', '-id')
+    # худший случай при холодном кеше: авторизованный пользователь и
+    # фильтр по тегам (list) - все фильтры вместе дают столько же
+    query_budget = {
+        'list': 8,
+        'retrieve': 7,
+        'create': 12,
+        'partial_update': 20,
+        'destroy': 15,
+        'download_shopping_cart': 2,
+        'shopping_cart_summary': 2,
+    }
+
+    def get_plan_serializer(self):
+        if self.get_serializer_class() is CachedRecipesSerializer:
+            # полные строки для промахов кеша загружает сам сериализатор
+            return None
+        return super().get_plan_serializer()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_serializer_class() is CachedRecipesSerializer:
+            queryset = queryset.only(*CachedRecipesSerializer.row_fields)
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def get_validators(self):
+        """Версия рецептов для ленты, дата изменения - для рецепта.
+
+        Ленте хватает версии из кеша, которую повышают сигналы: выдача
+        не фильтруется и не считается второй раз ради ETag.
+        """
+        if self.action == 'list':
+            return None, get_recipes_version()
+        updated_at = Recipe.objects.filter(
+            pk=self.kwargs[self.lookup_field]
+        ).values_list('updated_at', flat=True).first()
+        return (updated_at, 1) if updated_at else None
+
+    def get_etag(self, request, *args, **kwargs):
+        self.validators = self.get_validators()
+        if self.validators is None:
+            return None
+        return make_etag(
+            request.get_full_path(),
+            self.validators,
+            get_catalogue_version(),
+            get_user_state(request.user)
+        )
+
+    def get_last_modified(self, request, *args, **kwargs):
+        # Для авторизованных ответ зависит ещё и от их избранного,
+        # поэтому дата изменения рецепта годится только для анонимов.
+        if (self.action == 'retrieve' and self.validators
+                and request.user.is_anonymous):
+            return self.validators[0]
+        return None
 
     def perform_create(self, serializer):
         serializer.save(
@@ -58,94 +160,135 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return RecipesPostSerializer
+        if (settings.RECIPE_FRAGMENT_CACHE
+                and self.action in ['list', 'retrieve']):
+            return CachedRecipesSerializer
         return RecipesSerializer
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_CART_RENDERERS,
             url_path='download_shopping_cart')
     def download_shopping_cart(self, request):
-        user = '_' + request.user.username
-        content_type = {'.txt': 'text/plain'}
-        recipes = Recipe.objects.filter(recipe_sh__user=request.user)
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__in=recipes).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    amount=Sum('amount')).order_by('ingredient__name',
-                                                   'amount')
-        file = user
-        preparation_file(file, settings.EXT, ingredients)
-        return FileResponse(open(file + settings.EXT, 'rb'),
-                            as_attachment=True,
-                            content_type=content_type[settings.EXT])
-
-
-class SubscriptionsViewSet(ListViewSet):
+        """Список покупок в формате из ?format= или заголовка Accept.
+
+        Файл не пишется на диск: готовые суммы из ShoppingListItem
+        читаются курсором и отдаются выбранным рендерером по мере
+        формирования.
+        """
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name', 'amount')
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart_summary')
+    def shopping_cart_summary(self, request):
+        """Число рецептов в корзине и суммы ингредиентов в JSON."""
+        items = optimize_queryset(
+            ShoppingListItem.objects.filter(user=request.user).order_by(
+                'ingredient__name'
+            ),
+            ShoppingListItemSerializer()
+        )
+        return Response({
+            'recipes_count': ShoppingCart.objects.filter(
+                user=request.user
+            ).count(),
+            'ingredients': ShoppingListItemSerializer(
+                items, many=True
+            ).data,
+        })
+
+
+class SubscriptionsViewSet(RecipesLimitMixin, ListViewSet):
     serializer_class = SubscriptionSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = FeedPagination
     ordering = ('author',)
+    keyset_ordering = ('id',)
+    query_budget = 5
+    queryset = User.objects.order_by('id')
 
     def get_queryset(self):
-        user = self.request.user
-        return User.objects.filter(
-            id__in=user.subscriber.values('author_id')).annotate(
-            recipes_count=Count('recipes')
+        return super().get_queryset().filter(
+            id__in=self.request.user.subscriber.values('author_id')
         )
 
 
-class SubscribeViewSet(CreateDestroyViewSet):
+class SubscribeViewSet(RecipesLimitMixin, CreateDestroyViewSet):
     queryset = Subscription.objects.all()
     serializer_class = SubscribeSerializer
+    recipes_lookup = 'author__recipes'
+    query_budget = {'create': 7, 'destroy': 4}
 
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
-        author = get_object_or_404(User, pk=self.kwargs['id'])
-        subscriber = self.request.user
-        return get_object_or_404(queryset, subscriber=subscriber,
-                                 author=author)
+        return get_object_or_404(queryset, subscriber=self.request.user,
+                                 author_id=self.kwargs['id'])
 
     def perform_create(self, serializer):
-        author = get_object_or_404(User, pk=self.kwargs['id'])
-        serializer.save(subscriber=self.request.user, author=author)
+        # автора уже загрузил и проверил SubscribeSerializer.validate
+        serializer.save(subscriber=self.request.user)
 
 
 class FavoriteViewSet(CreateDestroyViewSet):
-    queryset = Favorite.objects.select_related('user', 'recipe').all()
+    queryset = Favorite.objects.all()
     serializer_class = FavoriteSerializer
     permission_classes = (IsAuthenticated,)
     ordering = ('recipe',)
+    query_budget = {'create': 6, 'destroy': 6}
 
     def get_object(self):
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['id'])
-        user = self.request.user
-        if not Favorite.objects.filter(user=user,
-                                       recipe=recipe).exists():
+        obj = self.get_queryset().filter(
+            user=self.request.user, recipe_id=self.kwargs['id']
+        ).first()
+        if obj is None:
+            get_object_or_404(Recipe, pk=self.kwargs['id'])
             raise BadRequestException(
-                {'errors': 'Этого рецепта нет в избранном!'},)
-        return get_object_or_404(Favorite, user=user,
-                                 recipe=recipe)
+                {'errors': 'Этого рецепта нет в избранном!'})
+        return obj
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['id'])
-        serializer.save(user=self.request.user, recipe=recipe)
+        # рецепт уже загрузил и проверил validate сериализатора; счётчик
+        # рецепта двигает сигнал в той же транзакции
+        serializer.save(user=self.request.user)
 
 
 class ShoppingCartViewSet(CreateDestroyViewSet):
-    queryset = ShoppingCart.objects.select_related('user', 'recipe').all()
+    queryset = ShoppingCart.objects.all()
     serializer_class = ShoppingCartSerializer
     permission_classes = (IsAuthenticated,)
     ordering = ('recipe',)
+    query_budget = {'create': 10, 'destroy': 8}
 
     def get_object(self):
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['id'])
-        user = self.request.user
-        if not ShoppingCart.objects.filter(user=user,
-                                           recipe=recipe).exists():
+        obj = self.get_queryset().filter(
+            user=self.request.user, recipe_id=self.kwargs['id']
+        ).first()
+        if obj is None:
+            get_object_or_404(Recipe, pk=self.kwargs['id'])
             raise BadRequestException(
                 {'errors': 'Этого рецепта нет в списке покупок!'})
-        return get_object_or_404(ShoppingCart, user=user,
-                                 recipe=recipe)
+        return obj
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['id'])
-        serializer.save(user=self.request.user, recipe=recipe)
+        # рецепт уже загрузил и проверил validate сериализатора; список
+        # покупок обновляет сигнал в той же транзакции
+        serializer.save(user=self.request.user)
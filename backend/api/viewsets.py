@@ -1,12 +1,58 @@
+from django.db.models import OuterRef, Subquery
+from recipes.models import Recipe
 from rest_framework import mixins, viewsets
+from rest_framework.pagination import _positive_int
 
+from api.prefetch import QueryPlanMixin
+from api.profiling import ProfilingMixin
 
-class ListViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+
+class ListViewSet(ProfilingMixin, QueryPlanMixin, mixins.ListModelMixin,
+                  viewsets.GenericViewSet):
 
     pass
 
 
 class CreateDestroyViewSet(
-    mixins.CreateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet
+    ProfilingMixin, QueryPlanMixin, mixins.CreateModelMixin,
+    mixins.DestroyModelMixin, viewsets.GenericViewSet
 ):
     pass
+
+
+class RecipesLimitMixin:
+    """Ограничение числа рецептов автора параметром recipes_limit."""
+    recipes_limit_query_param = 'recipes_limit'
+    recipes_lookup = 'recipes'
+
+    def get_recipes_limit(self):
+        try:
+            return _positive_int(
+                self.request.query_params[self.recipes_limit_query_param],
+                strict=True
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def get_recipes_queryset(self):
+        """Последние recipes_limit рецептов каждого автора.
+
+        Ограничение задаётся коррелированным подзапросом с LIMIT, так что
+        все авторы страницы получают свои top-N рецептов одним запросом.
+        Window(RowNumber()) с фильтром row_number <= limit Django 3.2 не
+        строит: фильтр по окну, даже во вложенном запросе, падает с
+        NotSupportedError. Подзапрос же читает по индексу
+        (author, -pub_date) не больше limit строк на автора, а
+        ROW_NUMBER нумеровал бы все рецепты авторов страницы.
+        """
+        recipes = Recipe.objects.all()
+        limit = self.get_recipes_limit()
+        if limit:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author'))
+                .order_by('-pub_date', '-id').values('pk')[:limit]
+            ))
+        return recipes
+
+    def get_prefetch_querysets(self):
+        return {self.recipes_lookup: self.get_recipes_queryset()}
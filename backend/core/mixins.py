@@ -0,0 +1,17 @@
+class CountersMixin:
+    """Не даёт save() затереть счётчики, которые двигает UPDATE с F().
+
+    Полный save() уже существующей строки записывает все поля, кроме
+    перечисленных в counter_fields: иначе он вернул бы в базу значения,
+    прочитанные до чужих инкрементов.
+    """
+    counter_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
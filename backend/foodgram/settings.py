@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.profiling.RequestProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -117,6 +118,11 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.TokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.parsers.LimitedJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "api.pagination.CustomPageNumberPagination",
     "PAGE_SIZE": 6,
 }
@@ -135,4 +141,81 @@ DJOSER = {
     },
 }
 
-EXT = '.txt'
+# версии справочников и рецептов живут в кеше: в продакшене он должен
+# быть общим для процессов (проверка recipes.E001 в check --deploy)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default="foodgram"),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# общая для всех пользователей часть JSON рецепта в ленте и карточке
+RECIPE_FRAGMENT_CACHE = True
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# готовые ответы ленты и карточки рецепта для анонимов; 0 - выключено
+ANONYMOUS_RECIPES_CACHE_TTL = int(
+    os.getenv("ANONYMOUS_RECIPES_CACHE_TTL", default="5")
+)
+# сколько после TTL отдаётся устаревший ответ, пока его пересчитывают
+ANONYMOUS_RECIPES_CACHE_STALE_TTL = 60
+ANONYMOUS_RECIPES_CACHE_LOCK_TIMEOUT = 10
+# сколько ждать чужого пересчёта, если устаревшего ответа нет
+ANONYMOUS_RECIPES_CACHE_WAIT = 1.0
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+INGREDIENT_AUTOCOMPLETE_IN_MEMORY = True
+INGREDIENT_AUTOCOMPLETE_TTL = 300
+
+RECIPE_IMAGE_VARIANTS = {
+    "thumbnail": 320,
+    "webp": 1280,
+}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_VARIANTS_ASYNC = True
+
+# base64 увеличивает изображение на треть, плюс остальные поля рецепта
+JSON_BODY_MAX_SIZE = RECIPE_IMAGE_MAX_BYTES * 4 // 3 + 1024 * 1024
+
+# конфигурация текстового поиска Postgres для ?search= ленты рецептов
+RECIPE_SEARCH_CONFIG = "russian"
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Доля профилируемых запросов: 0 - выключено, 1 - все запросы
+REQUEST_PROFILING_SAMPLE_RATE = float(
+    os.getenv("REQUEST_PROFILING_SAMPLE_RATE", default="0.01")
+)
+# Сколько одинаковых SQL за запрос считать признаком N+1
+REQUEST_PROFILING_DUPLICATE_THRESHOLD = 5
+REQUEST_PROFILING_SERVER_TIMING = True
+# В тестах: превышение query_budget представления - исключение
+REQUEST_PROFILING_STRICT = False
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "api.profiling": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_PROFILING_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+    },
+}
@@ -5,3 +5,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
 application = get_wsgi_application()
+
+# индекс автодополнения грузится здесь, а не в AppConfig.ready: там он
+# обращался бы к базе при каждой команде manage.py, в том числе migrate
+from recipes.autocomplete import warm_up_autocomplete  # noqa: E402
+
+warm_up_autocomplete()
@@ -4,6 +4,7 @@ from django.contrib.admin import TabularInline
 
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.shopping_list import track_recipe_ingredients
 
 
 class IngredientInline(TabularInline):
@@ -39,6 +40,8 @@ class RecipeAdmin(admin.ModelAdmin):
         'cooking_time',
         'author',
         'image',
+        'count_favorite',
+        'in_carts_count',
     )
     list_display_links = ('name', 'pub_date', 'text', 'cooking_time', 'author')
     list_editable = ('image',)
@@ -47,11 +50,18 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ['name']
     list_filter = ('author', 'tags')
     ordering = ('pub_date',)
+    readonly_fields = ('favorites_count', 'in_carts_count')
     inlines = (IngredientInline,)
 
-    @admin.display(description='Добавили в избранное', ordering='author')
+    @admin.display(description='Добавили в избранное',
+                   ordering='favorites_count')
     def count_favorite(self, obj):
-        return obj.recipe.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        # ингредиенты из inline-формы попадают в списки покупок
+        with track_recipe_ingredients(form.instance):
+            super().save_related(request, form, formsets, change)
 
 
 @admin.register(Favorite)
@@ -0,0 +1,102 @@
+"""Автодополнение названий ингредиентов по префиксу."""
+
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models.functions import Lower
+
+from recipes.models import Ingredient
+
+
+def search_ingredients(prefix, limit):
+    """Поиск по префиксу в БД через индекс по LOWER(name)."""
+    return list(
+        Ingredient.objects.annotate(name_lower=Lower('name'))
+        .filter(name_lower__startswith=prefix.lower())
+        .order_by('name_lower', 'id')
+        .values('id', 'name', 'measurement_unit')[:limit]
+    )
+
+
+class IngredientPrefixIndex:
+    """Отсортированный массив названий ингредиентов в памяти процесса.
+
+    Загружается при старте веб-процесса (warm_up_autocomplete) или при
+    первом обращении, сбрасывается сигналами сохранения и удаления
+    Ingredient и перечитывается не реже раза в INGREDIENT_AUTOCOMPLETE_TTL
+    секунд - изменения, сделанные в других процессах, доходят не позже
+    этого срока.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = 0
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def is_fresh(self, snapshot):
+        return (
+            snapshot is not None
+            and time.monotonic() - self._loaded_at
+            < settings.INGREDIENT_AUTOCOMPLETE_TTL
+        )
+
+    def get_snapshot(self):
+        snapshot = self._snapshot
+        if self.is_fresh(snapshot):
+            return snapshot
+        with self._lock:
+            if self.is_fresh(self._snapshot):
+                return self._snapshot
+            rows = sorted(
+                (
+                    (row['name'].lower(), row['id'], row)
+                    for row in Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                ),
+                key=lambda item: item[:2]
+            )
+            snapshot = (
+                [key for key, _, _ in rows],
+                [row for _, _, row in rows],
+            )
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+        return snapshot
+
+    def search(self, prefix, limit):
+        keys, rows = self.get_snapshot()
+        prefix = prefix.lower()
+        result = []
+        index = bisect_left(keys, prefix)
+        while (index < len(keys) and len(result) < limit
+               and keys[index].startswith(prefix)):
+            result.append(rows[index])
+            index += 1
+        return result
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+def warm_up_autocomplete():
+    """Загружает индекс при старте веб-процесса, до первого запроса."""
+    if not settings.INGREDIENT_AUTOCOMPLETE_IN_MEMORY:
+        return
+    try:
+        ingredient_index.get_snapshot()
+    except DatabaseError:
+        # база ещё не готова: индекс загрузится при первом поиске
+        pass
+
+
+def autocomplete(prefix, limit):
+    if settings.INGREDIENT_AUTOCOMPLETE_IN_MEMORY:
+        return ingredient_index.search(prefix, limit)
+    return search_ingredients(prefix, limit)
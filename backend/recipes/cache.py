@@ -0,0 +1,56 @@
+"""Версии справочников и рецептов для ключей кеша и ETag."""
+
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+RECIPES_VERSION_KEY = 'recipes:version'
+
+
+def cache_is_shared():
+    """Видят ли кеш другие процессы.
+
+    Версии и счётчики в LocMemCache остаются в процессе, который их
+    изменил: веб-процессы не узнают о правках из команд и друг от друга.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Ключ мог быть вытеснен: начинаем с метки времени, чтобы не
+        # совпасть со старыми версиями, ещё лежащими в кеше.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_catalogue_version():
+    """Версия справочников (теги, ингредиенты) для ключей кеша."""
+    return get_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    bump_version(CATALOGUE_VERSION_KEY)
+
+
+def get_recipes_version():
+    """Версия рецептов: меняется при любом изменении их JSON."""
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def bump_recipes_version():
+    # после коммита: до него другие запросы ещё видят старые строки
+    transaction.on_commit(lambda: bump_version(RECIPES_VERSION_KEY))
@@ -0,0 +1,17 @@
+from django.core.checks import Error, Tags, register
+
+from recipes.cache import cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии справочников и рецептов должны быть общими для процессов."""
+    if cache_is_shared():
+        return []
+    return [Error(
+        'Кеш по умолчанию локален для процесса.',
+        hint=('Версии справочников и рецептов, которые меняют команды и '
+              'другие процессы, не дойдут до веб-процессов. Укажите общий '
+              'кеш в CACHE_BACKEND и CACHE_LOCATION, например memcached.'),
+        id='recipes.E001',
+    )]
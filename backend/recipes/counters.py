@@ -0,0 +1,52 @@
+"""Счётчики избранного, корзин и рецептов на строках моделей."""
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+# считаемая модель: (модель со счётчиком, поле-счётчик, ссылка на неё)
+COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe'),
+    Recipe: (User, 'recipes_count', 'author'),
+}
+
+
+def update_counter(instance, delta):
+    """Сдвигает счётчик на delta одним UPDATE с F(), без гонок."""
+    model, field, lookup = COUNTERS[type(instance)]
+    rows = model.objects.filter(pk=getattr(instance, f'{lookup}_id'))
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def actual_count(counted, lookup):
+    return Coalesce(Subquery(
+        counted.objects.filter(**{lookup: OuterRef('pk')})
+        .order_by().values(lookup)
+        .annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount(dry_run=False):
+    """Пересчитывает разошедшиеся счётчики.
+
+    Возвращает число исправленных (при dry_run - найденных) строк
+    для каждого счётчика.
+    """
+    drifted = {}
+    for counted, (model, field, lookup) in COUNTERS.items():
+        rows = model.objects.annotate(
+            actual=actual_count(counted, lookup)
+        ).exclude(**{field: F('actual')})
+        drifted[f'{model.__name__}.{field}'] = rows.count()
+        if not dry_run and drifted[f'{model.__name__}.{field}']:
+            model.objects.filter(pk__in=rows.values('pk')).update(
+                **{field: actual_count(counted, lookup)}
+            )
+    return drifted
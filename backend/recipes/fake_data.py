@@ -0,0 +1,241 @@
+"""Синтетические данные для нагрузочных замеров."""
+
+import random
+import time
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from recipes.counters import recount
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.search import update_search_index
+from recipes.shopping_list import rebuild_shopping_lists
+from users.models import Subscription, User
+
+FAKE_PASSWORD = 'fake-data-password'
+FAKE_IMAGE = 'recipes/images/fake.png'
+INGREDIENTS_MODE = 7
+FAKE_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+    ('Десерт', 'dessert', '#D2699C'),
+    ('Перекус', 'snack', '#F2C94C'),
+)
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Плов', 'Омлет', 'Запеканка',
+    'Паста', 'Каша', 'Жаркое', 'Рулет', 'Соус', 'Гуляш', 'Торт',
+)
+STYLES = (
+    'по-домашнему', 'по-итальянски', 'по-грузински', 'по-деревенски',
+    'на скорую руку', 'от шефа', 'для всей семьи', 'к празднику',
+)
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса закона Ципфа для random.choices."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, size + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class FakeDataGenerator:
+    """Заполняет базу случайными, но воспроизводимыми данными.
+
+    Популярность авторов, рецептов и ингредиентов распределена по закону
+    Ципфа: немногие получают большую часть подписок, избранного и
+    упоминаний. Строки вставляются пакетами через bulk_create, поэтому
+    счётчики в конце пересчитываются одним проходом.
+    """
+
+    def __init__(self, seed=0, zipf=1.1, batch_size=5000,
+                 min_ingredients=3, max_ingredients=20, log=None):
+        self.rng = random.Random(seed)
+        self.zipf = zipf
+        self.batch_size = batch_size
+        self.min_ingredients = min_ingredients
+        self.max_ingredients = max_ingredients
+        # чаще всего в рецепте около семи ингредиентов, но мода должна
+        # лежать внутри заданного диапазона
+        self.ingredients_mode = min(max(INGREDIENTS_MODE, min_ingredients),
+                                    max_ingredients)
+        self.log = log or (lambda message: None)
+
+    def insert(self, model, objects):
+        started = time.monotonic()
+        before = model.objects.count()
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        created = model.objects.count() - before
+        elapsed = time.monotonic() - started
+        self.log(f'{model.__name__}: {created} строк, '
+                 f'{created / elapsed if elapsed else created:.0f} строк/с')
+        return created
+
+    def rank(self, population):
+        """Перемешивает population и считает для него веса Ципфа."""
+        population = list(population)
+        self.rng.shuffle(population)
+        return population, zipf_weights(len(population), self.zipf)
+
+    def popular(self, ranked, k):
+        """k элементов с повторами, популярность по закону Ципфа."""
+        population, weights = ranked
+        return self.rng.choices(population, cum_weights=weights, k=k)
+
+    def sample_distinct(self, ranked, k):
+        k = min(k, len(ranked[0]))
+        chosen = []
+        seen = set()
+        while len(chosen) < k:
+            for item in self.popular(ranked, k - len(chosen)):
+                if item not in seen:
+                    seen.add(item)
+                    chosen.append(item)
+        return chosen[:k]
+
+    def pairs(self, count, left, right, distinct=False):
+        """count различных пар: left равномерно, right по Ципфу.
+
+        distinct отбрасывает пары из одинаковых значений (подписка на
+        самого себя).
+        """
+        count = min(count, len(left) * len(right[0]))
+        width = max(right[0]) + 1
+        seen = set()
+        attempts = 0
+        while len(seen) < count and attempts < count * 20:
+            size = min(count - len(seen), self.batch_size)
+            attempts += size
+            for a, b in zip(self.rng.choices(left, k=size),
+                            self.popular(right, size)):
+                key = a * width + b
+                if key not in seen and not (distinct and a == b):
+                    seen.add(key)
+                    yield a, b
+
+    def create_tags(self):
+        for name, slug, color in FAKE_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count):
+        password = make_password(FAKE_PASSWORD)
+        start = (User.objects.order_by('-id')
+                 .values_list('id', flat=True).first() or 0) + 1
+        self.insert(User, (
+            User(username=f'fake{number}',
+                 email=f'fake{number}@example.org',
+                 first_name='Поварёнок', last_name=str(number),
+                 password=password)
+            for number in range(start, start + count)
+        ))
+        return list(User.objects.order_by('id').values_list('id', flat=True))
+
+    def recipe_rows(self, count, authors, ingredients, names):
+        """Рецепты и их ингредиенты, пакетами по batch_size."""
+        for batch in batched(self.popular(authors, count), self.batch_size):
+            rows = []
+            for author_id in batch:
+                chosen = self.sample_distinct(ingredients, round(
+                    self.rng.triangular(self.min_ingredients,
+                                        self.max_ingredients,
+                                        self.ingredients_mode)
+                ))
+                recipe = Recipe(
+                    author_id=author_id,
+                    name=(f'{self.rng.choice(DISHES)} '
+                          f'{self.rng.choice(STYLES)}'),
+                    text='Возьмите ' + ', '.join(
+                        names[ingredient_id] for ingredient_id in chosen
+                    ) + '. Перемешайте и готовьте до готовности.',
+                    cooking_time=self.rng.randint(5, 180),
+                    image=FAKE_IMAGE,
+                )
+                rows.append((recipe, chosen))
+            yield rows
+
+    def create_recipes(self, count, authors, tag_ids):
+        names = dict(
+            Ingredient.objects.order_by('id').values_list('id', 'name')
+        )
+        ingredients = self.rank(names)
+        started = time.monotonic()
+        created = 0
+        for rows in self.recipe_rows(count, authors, ingredients, names):
+            last_id = (Recipe.objects.order_by('-id')
+                       .values_list('id', flat=True).first() or 0)
+            Recipe.objects.bulk_create([recipe for recipe, _ in rows])
+            # bulk_create не возвращает id на всех СУБД: берём новые
+            # строки в порядке вставки
+            ids = Recipe.objects.filter(id__gt=last_id).order_by(
+                'id').values_list('id', flat=True)
+            links, tags = [], []
+            for recipe_id, (_, chosen) in zip(ids, rows):
+                links += [
+                    IngredientRecipe(recipe_id=recipe_id,
+                                     ingredient_id=ingredient_id,
+                                     amount=self.rng.randint(1, 20))
+                    for ingredient_id in chosen
+                ]
+                tags += [
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                    for tag_id in self.rng.sample(
+                        tag_ids, self.rng.randint(1, 2))
+                ]
+            IngredientRecipe.objects.bulk_create(links)
+            Recipe.tags.through.objects.bulk_create(tags)
+            created += len(rows)
+        elapsed = time.monotonic() - started
+        self.log(f'Recipe: {created} строк, '
+                 f'{created / elapsed if elapsed else created:.0f} строк/с')
+        return list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    @transaction.atomic
+    def generate(self, users, recipes, favorites, cart, subscriptions):
+        if not Ingredient.objects.exists():
+            raise ValueError('Сначала загрузите ингредиенты: '
+                             'python manage.py load_ingredients.')
+        if not default_storage.exists(FAKE_IMAGE):
+            buffer = BytesIO()
+            Image.new('RGB', (64, 64), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(FAKE_IMAGE, ContentFile(buffer.getvalue()))
+        tag_ids = self.create_tags()
+        user_ids = self.create_users(users)
+        authors = self.rank(user_ids)
+        recipe_ids = self.rank(self.create_recipes(recipes, authors, tag_ids))
+        self.insert(Favorite, (
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in self.pairs(
+                favorites, user_ids, recipe_ids)
+        ))
+        self.insert(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in self.pairs(cart, user_ids, recipe_ids)
+        ))
+        self.insert(Subscription, (
+            Subscription(subscriber_id=subscriber_id, author_id=author_id)
+            for subscriber_id, author_id in self.pairs(
+                subscriptions, user_ids, authors, distinct=True)
+        ))
+        recount()
+        rebuild_shopping_lists()
+        update_search_index()
@@ -0,0 +1,143 @@
+"""Уменьшенные копии изображений рецептов в WebP."""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.cache import bump_recipes_version
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants/'
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+# задачи executor, которые ещё не завершились; меняются из потоков
+# executor, поэтому только под pending_lock
+pending = set()
+pending_lock = threading.Lock()
+
+
+def variants_are_current(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') == recipe.image.name
+    )
+
+
+def variant_files(variants):
+    """Имена файлов копий из image_variants, без исходного изображения."""
+    return {name for key, name in variants.items() if key != 'source'}
+
+
+def delete_image_variants(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def render_variant(image, max_side):
+    variant = image.copy()
+    variant.thumbnail((max_side, max_side))
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def build_image_variants(recipe_id, image_name):
+    """Строит уменьшенные WebP-копии изображения рецепта.
+
+    Результат записывается в image_variants, только если у рецепта всё
+    ещё то же изображение: иначе копии устарели, пока строились, и их
+    файлы удаляются. Файлы прежних копий удаляются после коммита.
+    """
+    with default_storage.open(image_name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    variants = {'source': image_name}
+    for variant, max_side in settings.RECIPE_IMAGE_VARIANTS.items():
+        variants[variant] = default_storage.save(
+            f'{VARIANTS_DIR}{stem}_{variant}.webp',
+            ContentFile(render_variant(image, max_side))
+        )
+    with transaction.atomic():
+        previous = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image=image_name
+        ).values_list('image_variants', flat=True).first()
+        if previous is None:
+            # рецепт удалён или изображение сменилось
+            delete_image_variants(variant_files(variants))
+            return variants
+        Recipe.objects.filter(pk=recipe_id).update(
+            image_variants=variants, updated_at=timezone.now()
+        )
+        bump_recipes_version()
+        stale = variant_files(previous) - variant_files(variants)
+        transaction.on_commit(lambda: delete_image_variants(stale))
+    return variants
+
+
+def build_image_variants_logged(recipe_id, image_name):
+    """build_image_variants, ошибки которого пишутся в лог.
+
+    Обработчик on_commit вызывается уже после коммита: исключение из
+    него дошло бы до клиента, хотя рецепт сохранён.
+    """
+    try:
+        build_image_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s рецепта %s',
+                         image_name, recipe_id)
+
+
+def run_in_worker(recipe_id, image_name):
+    close_old_connections()
+    try:
+        build_image_variants_logged(recipe_id, image_name)
+    finally:
+        close_old_connections()
+
+
+def forget_future(future):
+    with pending_lock:
+        pending.discard(future)
+
+
+def submit_image_variants(recipe_id, image_name):
+    future = executor.submit(run_in_worker, recipe_id, image_name)
+    with pending_lock:
+        pending.add(future)
+    future.add_done_callback(forget_future)
+
+
+def wait_for_image_variants(timeout=None):
+    """Ждёт обработки всех поставленных в очередь изображений."""
+    with pending_lock:
+        futures = list(pending)
+    wait(futures, timeout)
+
+
+def schedule_image_variants(recipe):
+    """Ставит обработку изображения в очередь после коммита транзакции."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    if settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(
+            lambda: submit_image_variants(recipe_id, image_name)
+        )
+    else:
+        transaction.on_commit(
+            lambda: build_image_variants_logged(recipe_id, image_name)
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_image_variants, variants_are_current
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений рецептов, для которых '
+            'их нет или они устарели (например, задача потерялась при '
+            'перезапуске).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='перестроить копии у всех рецептов')
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        )
+        for recipe in recipes.iterator():
+            if not options['all'] and variants_are_current(recipe):
+                continue
+            try:
+                build_image_variants(recipe.pk, recipe.image.name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {built}, ошибок: {failed}.'
+        ))
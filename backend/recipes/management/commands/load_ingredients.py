@@ -1,16 +1,125 @@
+import csv
 import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.autocomplete import ingredient_index
+from recipes.cache import bump_catalogue_version, cache_is_shared
 from recipes.models import Ingredient
 
+DEFAULT_FILE = './data/ingredients.json'
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    """Потоково разбирает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        started = False
+        eof = False
+        while True:
+            buffer = buffer.lstrip()
+            if not started and buffer:
+                if buffer[0] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов.')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] == ',':
+                buffer = buffer[1:]
+                continue
+            if buffer[:1] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Некорректный JSON в файле.')
+                chunk = f.read(READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON пакетами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=DEFAULT_FILE)
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true')
+
     def handle(self, *args, **options):
-        with open('./data/ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for line in data:
-                Ingredient.objects.get_or_create(
-                    name=line['name'].lower(),
-                    measurement_unit=line['measurement_unit'].lower(),
+        path = options['file']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        rows = 0
+        with transaction.atomic():
+            for batch in batched(reader(path), options['batch_size']):
+                rows += len(batch)
+                if options['dry_run']:
+                    continue
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(
+                            name=name.strip().lower(),
+                            measurement_unit=measurement_unit.strip().lower()
+                        ) for name, measurement_unit in batch
+                    ],
+                    ignore_conflicts=True
                 )
+        elapsed = time.monotonic() - started
+        created = Ingredient.objects.count() - before
+        if created:
+            # bulk_create не отправляет post_save
+            ingredient_index.invalidate()
+            bump_catalogue_version()
+            if not cache_is_shared():
+                self.stderr.write(self.style.WARNING(
+                    'Кеш локален для процесса: запущенные веб-процессы '
+                    'увидят новые ингредиенты только после перезапуска.'
+                ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {rows}, добавлено: {created}'
+            f'{" (dry-run)" if options["dry_run"] else ""}, '
+            f'{rows / elapsed if elapsed else rows:.0f} строк/с.'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Сверяет списки покупок (ShoppingListItem) с корзинами '
+            'и исправляет разошедшиеся строки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать число расхождений')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='пользователей за один проход')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = rebuild_shopping_lists(
+                dry_run=options['dry_run'],
+                batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Найдено" if options["dry_run"] else "Исправлено"} '
+            f'расхождений: {drifted}.'
+        ))
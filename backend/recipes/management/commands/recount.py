@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, корзин и рецептов автора '
+            'и исправляет разошедшиеся значения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать число расхождений')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = recount(dry_run=options['dry_run'])
+        for counter, count in drifted.items():
+            self.stdout.write(f'{counter}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Найдено" if options["dry_run"] else "Исправлено"} '
+            f'расхождений: {sum(drifted.values())}.'
+        ))
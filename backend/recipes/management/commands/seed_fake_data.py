@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.fake_data import FakeDataGenerator
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных тестов. '
+            'Ингредиенты загружаются заранее командой load_ingredients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=200000)
+        parser.add_argument('--favorites', type=int, default=1000000)
+        parser.add_argument('--cart', type=int, default=200000)
+        parser.add_argument('--subscriptions', type=int, default=100000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=20)
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='показатель закона Ципфа для популярности')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        counts = ('users', 'recipes', 'favorites', 'cart', 'subscriptions')
+        if any(options[name] < 0 for name in counts):
+            raise CommandError('Количество строк не может быть меньше нуля.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if not (1 <= options['min_ingredients']
+                <= options['max_ingredients'] <= 20):
+            raise CommandError('Нужно 1 <= --min-ingredients '
+                               '<= --max-ingredients <= 20.')
+        if options['zipf'] <= 0:
+            raise CommandError('--zipf должен быть больше нуля.')
+
+        generator = FakeDataGenerator(
+            seed=options['seed'],
+            zipf=options['zipf'],
+            batch_size=options['batch_size'],
+            min_ingredients=options['min_ingredients'],
+            max_ingredients=options['max_ingredients'],
+            log=self.stdout.write,
+        )
+        started = time.monotonic()
+        try:
+            generator.generate(**{name: options[name] for name in counts})
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с.'
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 11:40
+
+from django.db import migrations
+
+INDEX_NAME = 'ingredient_name_lower_idx'
+
+CREATE_INDEX = {
+    # text_pattern_ops позволяет Postgres использовать индекс для
+    # LIKE 'x%' при любой collation базы
+    'postgresql': (
+        f'CREATE INDEX {INDEX_NAME} ON recipes_ingredient '
+        '(LOWER(name) text_pattern_ops)'
+    ),
+    'sqlite': f'CREATE INDEX {INDEX_NAME} ON recipes_ingredient (LOWER(name))',
+}
+
+
+def create_index(apps, schema_editor):
+    sql = CREATE_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 3.2 on 2026-10-18 15:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='TagRecipe',
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2 on 2026-10-18 21:30
+
+from django.conf import settings
+from django.db import migrations
+
+FTS_TABLE = 'recipes_recipe_fts'
+INGREDIENT_NAMES = (
+    "SELECT {concat} FROM recipes_ingredientrecipe AS link "
+    "JOIN recipes_ingredient AS ingredient "
+    "ON ingredient.id = link.ingredient_id "
+    "WHERE link.recipe_id = recipe.id"
+)
+
+CREATE = {
+    'postgresql': (
+        'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+        'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+        'USING gin (search_vector)',
+        "UPDATE recipes_recipe AS recipe SET search_vector = "
+        "setweight(to_tsvector(%(config)s::regconfig, recipe.name), 'A') || "
+        "setweight(to_tsvector(%(config)s::regconfig, coalesce(("
+        + INGREDIENT_NAMES.format(concat="string_agg(ingredient.name, ' ')")
+        + "), '')), 'B') || "
+        "setweight(to_tsvector(%(config)s::regconfig, recipe.text), 'C')",
+    ),
+    'sqlite': (
+        f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+        'name, ingredients, text, tokenize="unicode61 remove_diacritics 2")',
+        f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+        'SELECT recipe.id, recipe.name, coalesce(('
+        + INGREDIENT_NAMES.format(concat="group_concat(ingredient.name, ' ')")
+        + "), ''), recipe.text FROM recipes_recipe AS recipe",
+    ),
+}
+DROP = {
+    'postgresql': (
+        'DROP INDEX IF EXISTS recipe_search_vector_idx',
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+    ),
+    'sqlite': (f'DROP TABLE IF EXISTS {FTS_TABLE}',),
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(
+            sql, {'config': settings.RECIPE_SEARCH_CONFIG}
+            if '%(config)s' in sql else None
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in DROP.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,9 @@
-"""recipes/models.py"""
+"""Рецепты, теги, ингредиенты, избранное, корзина и списки покупок."""
 
 
 from colorfield.fields import ColorField
 from core.constants import Limits
+from core.mixins import CountersMixin
 from django.contrib.auth import get_user_model
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
@@ -62,7 +63,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -94,6 +95,12 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Вариант сервировки'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     text = models.TextField(
         verbose_name='Как приготовить'
     )
@@ -115,11 +122,39 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    # счётчики поддерживают сигналы, расхождения чинит команда recount;
+    # save() их не записывает (CountersMixin)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавили в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавили в корзину'
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
+
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     def __str__(self):
         return self.name
@@ -166,19 +201,6 @@ class IngredientRecipe(models.Model):
         return f'{self.recipe}: ' f'({self.ingredient}) - {self.amount}'
 
 
-class TagRecipe(models.Model):
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
-
-    class Meta:
-        verbose_name = 'Тэг для рецепта'
-        verbose_name_plural = 'Тэги для рецепта'
-        ordering = ('-recipe',)
-
-    def __str__(self):
-        return f'{self.tag} {self.recipe}'
-
-
 class AbstractUserRecipe(models.Model):
     user = models.ForeignKey(
         User,
@@ -210,6 +232,39 @@ class ShoppingCart(AbstractUserRecipe):
                 f'рецепт в корзину {ShoppingCart.recipe}')
 
 
+class ShoppingListItem(models.Model):
+    # сумма ингредиента по рецептам в корзине пользователя; строки
+    # поддерживает recipes/shopping_list.py, расхождения чинит команда
+    # rebuild_shopping_lists
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
 class Favorite(AbstractUserRecipe):
     user = models.ForeignKey(
         User,
@@ -0,0 +1,135 @@
+"""Полнотекстовый поиск рецептов на Postgres и SQLite."""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import (BooleanField, Exists, FloatField, OuterRef, Q,
+                              Value)
+from django.db.models.expressions import RawSQL
+
+from recipes.models import IngredientRecipe
+
+# Документ рецепта: название (вес A), названия ингредиентов (B) и текст
+# (C). На Postgres это колонка recipes_recipe.search_vector с GIN-индексом,
+# на SQLite - таблица FTS5; обе создаёт миграция 0011 и обновляют сигналы.
+FTS_TABLE = 'recipes_recipe_fts'
+# веса bm25 для колонок FTS_TABLE: name, ingredients, text
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+WORD_RE = re.compile(r'\w+')
+
+INGREDIENT_NAMES = (
+    "SELECT {concat} FROM recipes_ingredientrecipe AS link "
+    "JOIN recipes_ingredient AS ingredient "
+    "ON ingredient.id = link.ingredient_id "
+    "WHERE link.recipe_id = recipe.id"
+)
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector(%s::regconfig, recipe.name), 'A') || "
+    "setweight(to_tsvector(%s::regconfig, coalesce(("
+    + INGREDIENT_NAMES.format(concat="string_agg(ingredient.name, ' ')")
+    + "), '')), 'B') || "
+    "setweight(to_tsvector(%s::regconfig, recipe.text), 'C')"
+)
+SQLITE_DOCUMENT = (
+    "recipe.id, recipe.name, coalesce(("
+    + INGREDIENT_NAMES.format(concat="group_concat(ingredient.name, ' ')")
+    + "), ''), recipe.text"
+)
+
+
+def get_where(recipe_ids, column):
+    if recipe_ids is None:
+        return '', []
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return None, []
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    return f' WHERE {column} IN ({placeholders})', recipe_ids
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает документы рецептов; None - всех рецептов."""
+    vendor = connection.vendor
+    where, params = get_where(recipe_ids, 'recipe.id')
+    if where is None:
+        return
+    with connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            config = settings.RECIPE_SEARCH_CONFIG
+            cursor.execute(
+                'UPDATE recipes_recipe AS recipe '
+                f'SET search_vector = {POSTGRES_DOCUMENT}{where}',
+                [config] * 3 + params
+            )
+        elif vendor == 'sqlite':
+            delete_from_search_index(recipe_ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+                f'SELECT {SQLITE_DOCUMENT} FROM recipes_recipe AS recipe'
+                f'{where}',
+                params
+            )
+
+
+def delete_from_search_index(recipe_ids=None):
+    """Для SQLite: строки FTS удалённых рецептов удаляются отдельно."""
+    if connection.vendor != 'sqlite':
+        return
+    where, params = get_where(recipe_ids, 'rowid')
+    if where is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}{where}', params)
+
+
+def get_fts_query(text):
+    """Слова запроса как префиксы: "сыр"* "тома"* - все должны найтись."""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(text.lower()))
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, с релевантностью search_rank.
+
+    Выдача упорядочена по убыванию релевантности, затем по дате.
+    """
+    vendor = connection.vendor
+    if not WORD_RE.search(text):
+        return queryset
+    if vendor == 'postgresql':
+        query = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = [settings.RECIPE_SEARCH_CONFIG, text]
+        queryset = queryset.filter(RawSQL(
+            f'recipes_recipe.search_vector @@ {query}', params,
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {query})', params,
+            output_field=FloatField()
+        ))
+    elif vendor == 'sqlite':
+        query = get_fts_query(text)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # Таблица FTS не описана моделью, а bm25() считается только в
+        # запросе с MATCH по ней самой: соединяем её через extra(), чтобы
+        # релевантность считалась за один проход по найденным строкам.
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[query],
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+        )
+    else:
+        # без полнотекстового индекса: подстрока в любом из полей
+        condition = Q()
+        for word in WORD_RE.findall(text):
+            condition &= (
+                Q(name__icontains=word) | Q(text__icontains=word)
+                | Exists(IngredientRecipe.objects.filter(
+                    recipe=OuterRef('pk'), ingredient__name__icontains=word
+                ))
+            )
+        queryset = queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
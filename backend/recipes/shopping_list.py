@@ -0,0 +1,165 @@
+"""Списки покупок, которые ведутся вместе с корзинами."""
+
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+
+def get_amounts(recipe_id):
+    """Количество каждого ингредиента рецепта: {id ингредиента: amount}."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id=recipe_id).order_by()
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def lock_users(user_ids):
+    """Блокирует строки пользователей до конца транзакции.
+
+    Блокировка упорядочивает параллельные изменения списков покупок:
+    иначе два запроса могут создать одну строку списка или потерять
+    чужой сдвиг. Порядок по pk исключает взаимные блокировки.
+    """
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+@transaction.atomic(savepoint=False)
+def change_amounts(user_ids, deltas):
+    """Сдвигает суммы ингредиентов в списках покупок пользователей.
+
+    user_ids - список id пользователей, deltas - изменения
+    {id ингредиента: delta}. Существующие строки меняются одним UPDATE,
+    недостающие создаются, обнулившиеся удаляются.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return
+    lock_users(user_ids)
+    items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+    items.filter(ingredient_id__in=deltas).update(amount=F('amount') + Case(
+        *(When(ingredient_id=ingredient_id, then=Value(delta))
+          for ingredient_id, delta in deltas.items()),
+        output_field=IntegerField()
+    ))
+    added = [
+        ingredient_id for ingredient_id, delta in deltas.items() if delta > 0
+    ]
+    if added:
+        existing = set(items.filter(ingredient_id__in=added).values_list(
+            'user_id', 'ingredient_id'
+        ))
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=deltas[ingredient_id])
+            for user_id in user_ids for ingredient_id in added
+            if (user_id, ingredient_id) not in existing
+        ])
+    if len(added) < len(deltas):
+        items.filter(amount__lte=0).delete()
+
+
+def change_cart(user_id, recipe_id, sign):
+    """Добавляет (sign=1) или вычитает (sign=-1) рецепт из списка покупок."""
+    change_amounts([user_id], {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in get_amounts(recipe_id).items()
+    })
+
+
+def change_recipe(recipe_id, deltas, batch_size=1000):
+    """Переносит изменение ингредиентов рецепта в списки покупок всех,
+    у кого он в корзине, пачками по batch_size пользователей."""
+    if not any(deltas.values()):
+        return
+    # пачки по возрастанию id: блокировки берутся в том же порядке,
+    # что и в других транзакциях
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).order_by('user_id').values_list('user_id', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        change_amounts(user_ids[start:start + batch_size], deltas)
+
+
+def remove_recipe(recipe_id, batch_size=1000):
+    """Вычитает удаляемый рецепт из списков покупок всех, у кого он в
+    корзине: по одному UPDATE и DELETE на пачку пользователей."""
+    change_recipe(recipe_id, {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_amounts(recipe_id).items()
+    }, batch_size)
+
+
+@contextmanager
+def track_recipe_ingredients(recipe):
+    """Сравнивает ингредиенты рецепта до и после блока with и переносит
+    разницу в списки покупок, например для inline-форм админки."""
+    before = get_amounts(recipe.pk) if recipe.pk else {}
+    yield
+    after = get_amounts(recipe.pk)
+    change_recipe(recipe.pk, {
+        ingredient_id: after.get(ingredient_id, 0)
+        - before.get(ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()
+    })
+
+
+def rebuild_shopping_lists(dry_run=False, batch_size=1000):
+    """Сверяет списки покупок с корзинами и исправляет расхождения.
+
+    Возвращает число исправленных (при dry_run - найденных) строк.
+    Пользователи обрабатываются пачками по batch_size.
+    """
+    user_ids = sorted(
+        set(ShoppingCart.objects.order_by().values_list('user_id', flat=True)
+            .distinct())
+        | set(ShoppingListItem.objects.values_list('user_id', flat=True)
+              .distinct())
+    )
+    drifted = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in ShoppingCart.objects.filter(
+                user_id__in=batch,
+                recipe__ingredients_recipes__isnull=False
+            ).order_by().values_list(
+                'user_id', 'recipe__ingredients_recipes__ingredient_id'
+            ).annotate(amount=Sum('recipe__ingredients_recipes__amount'))
+        }
+        current = {
+            (user_id, ingredient_id): (pk, amount)
+            for pk, user_id, ingredient_id, amount
+            in ShoppingListItem.objects.filter(user_id__in=batch)
+            .values_list('pk', 'user_id', 'ingredient_id', 'amount')
+        }
+        wrong = [
+            key for key in expected.keys() | current.keys()
+            if expected.get(key) != current.get(key, (None, None))[1]
+        ]
+        drifted += len(wrong)
+        if dry_run or not wrong:
+            continue
+        stale = [current[key][0] for key in wrong if key in current]
+        for chunk in range(0, len(stale), batch_size):
+            ShoppingListItem.objects.filter(
+                pk__in=stale[chunk:chunk + batch_size]
+            ).delete()
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=expected[user_id, ingredient_id])
+            for user_id, ingredient_id in wrong
+            if (user_id, ingredient_id) in expected
+        ])
+    return drifted
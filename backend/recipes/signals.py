@@ -0,0 +1,153 @@
+"""Сигналы: кеши, счётчики, поиск и списки покупок."""
+
+from threading import local
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.autocomplete import ingredient_index
+from recipes.cache import bump_catalogue_version, bump_recipes_version
+from recipes.counters import update_counter
+from recipes.images import (delete_image_variants, schedule_image_variants,
+                            variant_files, variants_are_current)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            User)
+from recipes.search import delete_from_search_index, update_search_index
+from recipes.shopping_list import change_cart, remove_recipe
+
+# поля автора, которые входят в JSON рецепта
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+class DeletingRecipes(local):
+    """id рецептов, которые удаляются в этом потоке.
+
+    Между pre_delete и post_delete рецепта каскадно удаляются его строки
+    корзины и избранного; рецепт обработан целиком, поэтому их
+    обработчики списков покупок и счётчиков ничего не делают.
+    """
+
+    def __init__(self):
+        self.ids = set()
+
+
+deleting_recipes = DeletingRecipes()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_catalogue_cache(**kwargs):
+    bump_catalogue_version()
+
+
+@receiver(pre_save, sender=User)
+def touch_author_recipes(instance, update_fields=None, **kwargs):
+    """Меняет updated_at рецептов автора, если изменились его данные.
+
+    От updated_at зависят ETag и ключи кеша фрагментов рецептов,
+    от версии рецептов - ETag ленты.
+    """
+    fields = [field for field in AUTHOR_FIELDS
+              if update_fields is None or field in update_fields]
+    if instance.pk is None or not fields:
+        return
+    saved = User.objects.filter(pk=instance.pk).values_list(*fields).first()
+    if saved is not None and saved != tuple(
+        getattr(instance, field) for field in fields
+    ):
+        Recipe.objects.filter(author=instance).update(
+            updated_at=timezone.now()
+        )
+        bump_recipes_version()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipes_version(**kwargs):
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    if instance.image and not variants_are_current(instance):
+        schedule_image_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_image_variants(instance, **kwargs):
+    names = variant_files(instance.image_variants)
+    if names:
+        transaction.on_commit(lambda: delete_image_variants(names))
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, **kwargs):
+    # ингредиенты сохраняются после рецепта: индексируем после коммита
+    transaction.on_commit(lambda: update_search_index([instance.pk]))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    delete_from_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def reindex_ingredient_recipes(instance, created=False, **kwargs):
+    if created:
+        return
+    recipe_ids = list(
+        instance.ingredients_recipes.values_list('recipe_id', flat=True)
+    )
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_index(recipe_ids))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+def increment_counter(instance, created, **kwargs):
+    if created:
+        update_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+def decrement_counter(sender, instance, **kwargs):
+    if sender is not Recipe and instance.recipe_id in deleting_recipes.ids:
+        # счётчики удаляемого рецепта уходят вместе с ним
+        return
+    update_counter(instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(instance, created, **kwargs):
+    if created:
+        change_cart(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(instance, **kwargs):
+    if instance.recipe_id not in deleting_recipes.ids:
+        change_cart(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    # Django шлёт все pre_delete до первого DELETE: ингредиенты рецепта
+    # ещё на месте, а post_delete строк корзины придут позже
+    remove_recipe(instance.pk)
+    deleting_recipes.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_deleted_recipe(instance, **kwargs):
+    deleting_recipes.ids.discard(instance.pk)
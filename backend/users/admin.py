@@ -13,6 +13,7 @@ class MyUserAdmin(UserAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
         'is_superuser',
         'is_staff',
         'is_active',
@@ -1,10 +1,11 @@
 from core.constants import Limits
+from core.mixins import CountersMixin
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 
-class User(AbstractUser):
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         _('email address'),
         max_length=Limits.MAX_LEN_EMAIL_FIELD.value,
@@ -22,10 +23,17 @@ class User(AbstractUser):
         _('last name'),
         max_length=Limits.MAX_LEN_USERS_CHARFIELD.value
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов'
+    )
 
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
     USERNAME_FIELD = 'email'
 
+    counter_fields = ('recipes_count',)
+
     class Meta:
         verbose_name = 'поварёнок'
         verbose_name_plural = 'Все поварята'
@@ -14,6 +14,13 @@ class Api {
     })
   }
 
+  paginationString ({ pagination, page, cursor }) {
+    if (pagination === 'cursor') {
+      return `pagination=cursor${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`
+    }
+    return `page=${page}`
+  }
+
   checkFileDownloadResponse (res) {
     return new Promise((resolve, reject) => {
       if (res.status < 400) {
@@ -109,13 +116,15 @@ class Api {
     is_favorited = 0,
     is_in_shopping_cart = 0,
     author,
-    tags
+    tags,
+    pagination = 'page',
+    cursor
   } = {}) {
       const token = localStorage.getItem('token')
       const authorization = token ? { 'authorization': `Token ${token}` } : {}
       const tagsString = tags ? tags.filter(tag => tag.value).map(tag => `&tags=${tag.slug}`).join('') : ''
       return fetch(
-        `/api/recipes/?page=${page}&limit=${limit}${author ? `&author=${author}` : ''}${is_favorited ? `&is_favorited=${is_favorited}` : ''}${is_in_shopping_cart ? `&is_in_shopping_cart=${is_in_shopping_cart}` : ''}${tagsString}`,
+        `/api/recipes/?${this.paginationString({ pagination, page, cursor })}&limit=${limit}${author ? `&author=${author}` : ''}${is_favorited ? `&is_favorited=${is_favorited}` : ''}${is_in_shopping_cart ? `&is_in_shopping_cart=${is_in_shopping_cart}` : ''}${tagsString}`,
         {
           method: 'GET',
           headers: {
@@ -267,11 +276,13 @@ class Api {
   getSubscriptions ({
     page, 
     limit = 6,
-    recipes_limit = 3
+    recipes_limit = 3,
+    pagination = 'page',
+    cursor
   }) {
     const token = localStorage.getItem('token')
     return fetch(
-      `/api/users/subscriptions/?page=${page}&limit=${limit}&recipes_limit=${recipes_limit}`,
+      `/api/users/subscriptions/?${this.paginationString({ pagination, page, cursor })}&limit=${limit}&recipes_limit=${recipes_limit}`,
       {
         method: 'GET',
         headers: {